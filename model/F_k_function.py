@@ -4,37 +4,60 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(project_root)
 
+import logging
 import math
+from typing import List
 import numpy as np
 from tqdm import tqdm
 
 from model.subsequence_method import *
+from model.suffix_array import SuffixArrayMatchIndex
+from model.pattern_sets import get_pattern_set
+from model.profile_cache import ProfileCache
+from model.profile_store import open_profile_store, sequence_hash
 from utils.sequence_tool import *
 from utils.logger import setup_logger
+from utils.telemetry import Telemetry, measure
 
+# F(k) is evaluated once per pair, inside the matrix workers: its progress messages
+# are DEBUG records, and formatted ones are only built when DEBUG is enabled
 logger = setup_logger()
 
+def empirical_k_range(L: float):
+    """k_min and k_max of the empirical formula for an average sequence length L"""
+    k_min = math.ceil((math.log(L) + 0.69) / 0.875)
+    k_max = math.floor(math.log(L) / 0.634)
+    return k_min, k_max
+
 class F_k_funtion:
-    def __init__(self, seq1:str, seq2:str, args:dict):
+    def __init__(self, seq1:str, seq2:str, args:dict, profile_cache: ProfileCache = None, seq_ids: tuple = None,
+                 telemetry: Telemetry = None):
         self.k_mers_method = args.get("k_mers_method", "basic_kmer_matches") # method to calculate F_k
         self.bool_use_single_seq = args.get("bool_use_single_seq", True) # whether taking reverse complement into account
         self.bool_use_empirical_formula = args.get("bool_use_empirical_formula", True) # whether using empirical formula to calculate k_min and k_max
         self.background_matches_method = args.get("background_matches_method", "basic_kmer_matches") # method to calculate background matches
         self.k_show_values = args.get("k_show_values", list(range(2, 25))) # k values to show
+        self.kmer_backend = args.get("kmer_backend", "string") # "string", "packed", "numpy", "canonical" or "suffix_array" k-mer counting
+        self.pattern_set = args.get("pattern_set", None) # RY pattern set used by start_pattern_matches
+        # extra pattern sets of args.pattern_set_path are registered by the matrix builders (load_config_pattern_sets)
+        self.spaced_seeds = args.get("spaced_seeds", 1) # number of fixed seed patterns averaged by spaced_word_matches
+        self.spaced_seed_rng = args.get("spaced_seed_rng", 0) # random seed that fixes the spaced seed patterns
+        if self.k_mers_method in PATTERN_SET_METHODS:
+            self.pattern_set = PATTERN_SET_METHODS[self.k_mers_method]
         self.seq1 = seq1
         self.seq2 = seq2
-        self.L_1 = len(seq1)
-        self.L_2 = len(seq2)
+        self.L_1 = len(seq1) - seq1.count(CONTIG_BOUNDARY) # bases only, for genome-level sequences
+        self.L_2 = len(seq2) - seq2.count(CONTIG_BOUNDARY)
         self.L = (self.L_1 + self.L_2) / 2  # Average length of the two sequences
 
         if self.bool_use_empirical_formula:
-            logger.info("Using empirical formula to calculate k_min and k_max")
+            logger.debug("Using empirical formula to calculate k_min and k_max")
             # using Empirical formula to calculate k_min and k_max
-            self.k_min = math.ceil((math.log(self.L) + 0.69) / 0.875)
-            self.k_max = math.floor(math.log(self.L) / 0.634)
-            logger.info(f"k_min: {self.k_min}, k_max: {self.k_max}")
+            self.k_min, self.k_max = empirical_k_range(self.L)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"k_min: {self.k_min}, k_max: {self.k_max}")
         else:
-            logger.info("Not using empirical formula to calculate k_min and k_max")
+            logger.debug("Not using empirical formula to calculate k_min and k_max")
             # TODO: reproduct John's idea to calculate k_min and k_max
             pass
 
@@ -42,123 +65,182 @@ class F_k_funtion:
         self.F_k_p_hat = []
         self.F_k_show = []
 
-        
+        # per-sequence profiles shared with the other pairs of a distance matrix,
+        # seq_ids = (id of seq1, id of seq2) names the sequences in the cache
+        self.profile_cache = profile_cache if seq_ids is not None else None
+        self.seq_ids = seq_ids
+        self.profile_store = open_profile_store(args) # on-disk profiles, args.profile_store_path
+        self._seq_hashes = [None, None]
+
+        # suffix array indexes shared by all k values, built on first use
+        self._match_index = None
+        self._background_index = None
+        self._index_max_k = 0
+
+        # per-stage timings and counts, see utils/telemetry.py (None records nothing)
+        self.telemetry = telemetry
+
+    def _skip_k(self, k: int) -> bool:
+        """RY pattern methods need k to cover the whole pattern"""
+        if self.pattern_set is not None and self.k_mers_method in list(PATTERN_SET_METHODS) + ["start_pattern_matches"]:
+            return k < pattern_word_length(self.pattern_set)
+        return False
+
+    def _use_match_index(self, method: str) -> bool:
+        return self.kmer_backend == "suffix_array" and match_method_spec(method, self.pattern_set) is not None
+
+    def _index_matches(self, index: SuffixArrayMatchIndex, method: str, k: int):
+        kmer_filter, form, _ = match_method_spec(method, self.pattern_set)
+        if form == "product":
+            return index.product_matches(k, kmer_filter)
+        return index.min_matches(k, kmer_filter)
+
+    def _use_profile_cache(self, method: str, k: int) -> bool:
+        return ((self.profile_cache is not None or self.profile_store is not None) and self.kmer_backend != "suffix_array"
+                and k <= MAX_PACKED_K and match_method_spec(method, self.pattern_set) is not None)
+
+    def _cached_profile(self, index: int, sequence: str, k: int, method: str, role: int, reversed_seq: bool = False):
+        params = (k, method, self.pattern_set, role, reversed_seq, bool(self.bool_use_single_seq), self.kmer_backend == "canonical")
+        # cache and store are keyed by the patterns themselves, not only by the set name,
+        # so profiles counted under another definition of the name are never reused
+        patterns = None
+        if method in PATTERN_SET_METHODS or method == "start_pattern_matches":
+            patterns = tuple(get_pattern_set(self.pattern_set))
+
+        def build():
+            with measure(self.telemetry, "profile", k) as counts:
+                profile = match_profile(reverse(sequence) if reversed_seq else sequence, k, method, role,
+                                        self.bool_use_single_seq, self.kmer_backend, self.pattern_set, self.telemetry)
+                counts["kmers"] = int(np.sum(profile.counts))
+                counts["bytes"] = len(sequence)
+            return profile
+
+        build_profile = build
+        if self.profile_store is not None:
+            if self._seq_hashes[index] is None:
+                self._seq_hashes[index] = sequence_hash(sequence)
+            build_profile = lambda: self.profile_store.get(self._seq_hashes[index], params + (patterns,), build)
+        if self.profile_cache is None:
+            return build_profile()
+        return self.profile_cache.get((self.seq_ids[index],) + params + (patterns,), build_profile)
+
+    def _cached_matches(self, k: int, method: str, reversed_seq2: bool = False):
+        profile1 = self._cached_profile(0, self.seq1, k, method, 1)
+        profile2 = self._cached_profile(1, self.seq2, k, method, 2, reversed_seq2)
+        with measure(self.telemetry, "intersect", k) as counts:
+            counts["kmers"] = len(profile1.codes) + len(profile2.codes)
+            return profile_matches(profile1, profile2, method, self.pattern_set)
+
+    def _build_index(self, strands1: List[str], strands2: List[str]) -> SuffixArrayMatchIndex:
+        with measure(self.telemetry, "index") as counts:
+            counts["bytes"] = sum(len(sequence) for sequence in strands1 + strands2)
+            return SuffixArrayMatchIndex(strands1, strands2, self._index_max_k)
+
+    def _measured_matches(self, k: int):
+        """matches and background matches of k, timed as the matches and background stages"""
+        with measure(self.telemetry, "matches", k) as counts:
+            counts["kmers"] = max(self.L_1 - k + 1, 0) + max(self.L_2 - k + 1, 0)
+            counts["bytes"] = self.L_1 + self.L_2
+            matches = self._calculate_matches(k)
+        with measure(self.telemetry, "background", k) as counts:
+            counts["kmers"] = max(self.L_1 - k + 1, 0) + max(self.L_2 - k + 1, 0)
+            counts["bytes"] = self.L_1 + self.L_2
+            background_matches = self._calculate_background_matches(k)
+        return matches, background_matches
+
+    def _calculate_matches(self, k: int):
+        if self._use_profile_cache(self.k_mers_method, k):
+            return self._cached_matches(k, self.k_mers_method)
+        if self._use_match_index(self.k_mers_method):
+            if self._match_index is None or self._match_index.max_k < k:
+                logger.debug("Building suffix array index for all k values")
+                both_strands_seq2 = match_method_spec(self.k_mers_method, self.pattern_set)[2]
+                strands1, strands2 = match_strands(self.seq1, self.seq2, self.bool_use_single_seq, both_strands_seq2)
+                self._match_index = self._build_index(strands1, strands2)
+            return self._index_matches(self._match_index, self.k_mers_method, k)
+        if self.k_mers_method == "basic_kmer_matches":
+            logger.debug("Using basic kmer matches to calculate F(k)")
+            return basic_kmer_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_ry_matches":
+            logger.debug("Using start_ry_matches to calculate F(k)")
+            return start_ry_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_rr_matches":
+            logger.debug("Using start_rr_matches to calculate F(k)")
+            return start_rr_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_ry_4_6_matches":
+            logger.debug("Using start_ry_4_6_matches to calculate F(k)")
+            return start_ry_4_6_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_ry_4_9_matches":
+            logger.debug("Using start_ry_4_9_matches to calculate F(k)")
+            return start_ry_4_9_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_ry_4_push_matches":
+            logger.debug("Using start_ry_4_push_matches to calculate F(k)")
+            return start_ry_4_push_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_ry_4_pull_matches":
+            logger.debug("Using start_ry_4_pull_matches to calculate F(k)")
+            return start_ry_4_pull_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "start_pattern_matches":
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Using start_pattern_matches with pattern set {self.pattern_set} to calculate F(k)")
+            return start_pattern_matches(self.seq1, self.seq2, k, self.pattern_set, self.bool_use_single_seq, self.kmer_backend)
+        elif self.k_mers_method == "spaced_word_matches":
+            logger.debug("Using spaced_word_matches to calculate F(k)")
+            return spaced_word_matches(self.seq1, self.seq2, k, self.bool_use_single_seq, self.kmer_backend,
+                                       self.spaced_seeds, self.spaced_seed_rng)
+        else:
+            logger.error("Invalid align-free method.")
+            raise ValueError("Invalid align-free method.")
+
+    def _calculate_background_matches(self, k: int):
+        if self.background_matches_method == "basic_kmer_matches" and self._use_profile_cache("basic_kmer_matches", k):
+            return self._cached_matches(k, "basic_kmer_matches", reversed_seq2=True)
+        elif self.background_matches_method == "basic_kmer_matches" and self._use_match_index("basic_kmer_matches"):
+            if self._background_index is None or self._background_index.max_k < k:
+                logger.debug("Building suffix array index for background matches")
+                strands1, strands2 = match_strands(self.seq1, reverse(self.seq2), self.bool_use_single_seq, False)
+                self._background_index = self._build_index(strands1, strands2)
+            return self._index_matches(self._background_index, "basic_kmer_matches", k)
+        elif self.background_matches_method == "basic_kmer_matches":
+            logger.debug("Using basic kmer matches to calculate background matches")
+            return basic_kmer_matches(self.seq1, reverse(self.seq2), k, self.bool_use_single_seq, self.kmer_backend)
+        elif self.background_matches_method == "static_method":
+            logger.debug("Using static method to calculate background matches")
+            return 2 * self.L_1 * self.L_2 * (1/4)**k
+        elif self.background_matches_method == "no_background_matches":
+            logger.debug("No background matches")
+            return 0
+        else:
+            logger.error("Invalid background matches method.")
+            raise ValueError("Invalid background matches method.")
+
     def calculate_p_hat(self):
-        logger.info("Calculating p_hat")
+        logger.debug("Calculating p_hat")
+        self._index_max_k = self.k_max
         for k in tqdm(range(self.k_min, self.k_max + 1), desc="Calculating F(k) for different k values"):
-            if self.k_mers_method == "start_ry_4_6_matches" and k < 6:
+            if self._skip_k(k):
                 continue
-            if self.k_mers_method == "start_ry_4_9_matches" and k < 9:
-                continue
-            if self.k_mers_method == "start_ry_4_push_matches" and k < 9:
-                continue
-            if self.k_mers_method == "start_ry_4_pull_matches" and k < 9:
-                continue
-            if self.k_mers_method == "basic_kmer_matches":
-                logger.info("Using basic kmer matches to calculate F(k)")
-                matches = basic_kmer_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_matches":
-                logger.info("Using start_ry_matches to calculate F(k)")
-                matches = start_ry_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_rr_matches":
-                logger.info("Using start_rr_matches to calculate F(k)")
-                matches = start_rr_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_6_matches":
-                logger.info("Using start_ry_4_6_matches to calculate F(k)")
-                matches = start_ry_4_6_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_9_matches":
-                logger.info("Using start_ry_4_9_matches to calculate F(k)")
-                matches = start_ry_4_9_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_push_matches":
-                logger.info("Using start_ry_4_push_matches to calculate F(k)")
-                matches = start_ry_4_push_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_pull_matches":
-                logger.info("Using start_ry_4_pull_matches to calculate F(k)")
-                matches = start_ry_4_pull_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "spaced_word_matches":
-                logger.info("Using spaced_word_matches to calculate F(k)")
-                matches = spaced_word_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            else:
-                logger.error("Invalid align-free method.")
-                raise ValueError("Invalid align-free method.")
-            
-            if self.background_matches_method == "basic_kmer_matches":
-                logger.info("Using basic kmer matches to calculate background matches")
-                background_matches = basic_kmer_matches(self.seq1, reverse(self.seq2), k, self.bool_use_single_seq)
-            elif self.background_matches_method == "static_method":
-                logger.info("Using static method to calculate background matches")
-                background_matches = 2 * self.L_1 * self.L_2 * (1/4)**k
-            elif self.background_matches_method == "no_background_matches":
-                logger.info("No background matches")
-                background_matches = 0
-            else:
-                logger.error("Invalid background matches method.")
-                raise ValueError("Invalid background matches method.")
-            
+            matches, background_matches = self._measured_matches(k)
             self.F_k_p_hat.append(np.log(matches - background_matches))
 
         # calculate p_hat
-        x = np.array([self.k_min, self.k_max])
-        y = np.array([self.F_k_p_hat[0], self.F_k_p_hat[-1]]) + 1e-10  # Prevent log(0) by adding a small value
-        slope, _ = np.polyfit(x, np.log(y), 1)  # Calculate slope by fitting log of match counts between k_min and k_max
-        self.p_hat = np.exp(slope)
-        logger.info(f"p_hat: {self.p_hat}")
+        with measure(self.telemetry, "fit"):
+            x = np.array([self.k_min, self.k_max])
+            y = np.array([self.F_k_p_hat[0], self.F_k_p_hat[-1]]) + 1e-10  # Prevent log(0) by adding a small value
+            slope, _ = np.polyfit(x, np.log(y), 1)  # Calculate slope by fitting log of match counts between k_min and k_max
+            self.p_hat = np.exp(slope)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"p_hat: {self.p_hat}")
 
         return self.p_hat
 
 
     def show_F_k_curve(self):
-        logger.info("Showing F(k) curve")
+        logger.debug("Showing F(k) curve")
+        self._index_max_k = max(self.k_show_values)
         for k in tqdm(self.k_show_values, desc="Showing F(k) curve"):
-            if self.k_mers_method == "start_ry_4_6_matches" and k < 6:
-                continue
-            if self.k_mers_method == "start_ry_4_9_matches" and k < 9:
-                continue
-            if self.k_mers_method == "start_ry_4_push_matches" and k < 9:
-                continue
-            if self.k_mers_method == "start_ry_4_pull_matches" and k < 9:
+            if self._skip_k(k):
                 continue
-            if self.k_mers_method == "basic_kmer_matches":
-                logger.info("Using basic kmer matches to calculate F(k)")
-                matches = basic_kmer_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_matches":
-                logger.info("Using start_ry_matches to calculate F(k)")
-                matches = start_ry_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_rr_matches":
-                logger.info("Using start_rr_matches to calculate F(k)")
-                matches = start_rr_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_6_matches":
-                logger.info("Using start_ry_4_6_matches to calculate F(k)")
-                matches = start_ry_4_6_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_9_matches":
-                logger.info("Using start_ry_4_9_matches to calculate F(k)")
-                matches = start_ry_4_9_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_push_matches":
-                logger.info("Using start_ry_4_push_matches to calculate F(k)")
-                matches = start_ry_4_push_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "start_ry_4_pull_matches":
-                logger.info("Using start_ry_4_pull_matches to calculate F(k)")
-                matches = start_ry_4_pull_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            elif self.k_mers_method == "spaced_word_matches":
-                logger.info("Using spaced_word_matches to calculate F(k)")
-                matches = spaced_word_matches(self.seq1, self.seq2, k, self.bool_use_single_seq)
-            else:
-                logger.error("Invalid align-free method.")
-                raise ValueError("Invalid align-free method.")
-
-            if self.background_matches_method == "basic_kmer_matches":
-                logger.info("Using basic kmer matches to calculate background matches")
-                background_matches = basic_kmer_matches(self.seq1, reverse(self.seq2), k, self.bool_use_single_seq)
-            elif self.background_matches_method == "static_method":
-                logger.info("Using static method to calculate background matches")
-                background_matches = 2 * self.L_1 * self.L_2 * (1/4)**k
-            elif self.background_matches_method == "no_background_matches":
-                logger.info("No background matches")
-                background_matches = 0
-            else:
-                logger.error("Invalid background matches method.")
-                raise ValueError("Invalid background matches method.")
-            
+            matches, background_matches = self._measured_matches(k)
             self.F_k_show.append(np.log(matches - background_matches))
 
         return self.F_k_show
@@ -0,0 +1,403 @@
+import concurrent.futures
+import os
+from typing import Dict, Iterable, List, Tuple
+
+from model.matrix_checkpoint import MatrixCheckpoint, matrix_fingerprint, open_matrix_checkpoint, read_checkpoint
+from model.pattern_sets import load_config_pattern_sets
+from model.profile_cache import make_profile_cache
+from model.sequence_store import SharedSequenceStore
+from model.F_k_function import empirical_k_range
+from model.upper_model import compute_distance
+from utils.file_system import phylip_name, read_phylip
+from utils.logger import attach_log_queue, get_log_queue, setup_logger
+from utils.telemetry import Telemetry
+
+logger = setup_logger()
+
+
+# state of a worker process, set up once by the pool initializer
+_worker_sequences = None
+_worker_configs = None
+_worker_profile_cache = None
+_worker_telemetry = None
+
+
+def _init_worker(shm_name: str, offsets, configs: List[dict], log_queue=None, telemetry: bool = False,
+                 n_workers: int = 1) -> None:
+    global _worker_sequences, _worker_configs, _worker_profile_cache, _worker_telemetry
+    attach_log_queue(log_queue)
+    _worker_sequences = SharedSequenceStore.attach(shm_name, offsets)
+    _worker_configs = configs
+    load_config_pattern_sets(configs)
+    _worker_profile_cache = make_profile_cache(configs[0], n_workers)
+    _worker_telemetry = Telemetry() if telemetry else None
+
+
+def _chunk_result(distances: List[float], telemetry: Telemetry):
+    """what a worker sends back for a chunk: the distances and the telemetry stages collected meanwhile"""
+    return distances, (telemetry.take() if telemetry is not None else None)
+
+
+def _distance_chunk(tasks: List[Tuple[int, int, int]]):
+    """distances of a chunk of (config, i, j) tasks, computed in a worker process"""
+    return _chunk_result([compute_distance(_worker_sequences[i], _worker_sequences[j], _worker_configs[m],
+                                           _worker_profile_cache, (i, j), _worker_telemetry)
+                          for m, i, j in tasks], _worker_telemetry)
+
+
+# state of a worker process that serves sequences from several shared memory
+# blocks (streamed datasets and the distance service), attached on first use
+_collection_sequences = {}
+_collection_profile_cache = None
+_collection_telemetry = None
+
+
+def _init_collection_worker(args: dict, log_queue=None, telemetry: bool = False, n_workers: int = 1) -> None:
+    global _collection_profile_cache, _collection_telemetry
+    attach_log_queue(log_queue)
+    _collection_profile_cache = make_profile_cache(args, n_workers)
+    _collection_telemetry = Telemetry() if telemetry else None
+
+
+def _collection_chunk(collections: Dict[str, object], refs: List[Tuple[str, int]], configs: List[dict],
+                      tasks: List[Tuple[int, int, int]]):
+    """
+    distances of a chunk of (config, i, j) tasks on the sequences refs[i] and refs[j],
+    each given as (shared memory block, index); collections maps the blocks to their offsets
+    """
+    # the configs come with every chunk (the service takes them per request)
+    load_config_pattern_sets(configs)
+    for shm_name, offsets in collections.items():
+        if shm_name not in _collection_sequences:
+            _collection_sequences[shm_name] = SharedSequenceStore.attach(shm_name, offsets)
+    distances = []
+    for m, i, j in tasks:
+        (name_i, index_i), (name_j, index_j) = refs[i], refs[j]
+        distances.append(compute_distance(_collection_sequences[name_i][index_i], _collection_sequences[name_j][index_j],
+                                          configs[m], _collection_profile_cache, (refs[i], refs[j]), _collection_telemetry))
+    return _chunk_result(distances, _collection_telemetry)
+
+
+def estimate_pair_cost(L1: int, L2: int, args: dict) -> float:
+    """
+    relative cost of one compute_distance call: every k of the empirical range
+    counts both sequences once, plus a second pass for the basic k-mer background
+    """
+    k_min, k_max = empirical_k_range(max((L1 + L2) / 2, 2))
+    cost = (L1 + L2) * max(k_max - k_min + 1, 1)
+    if args.get("background_matches_method", "basic_kmer_matches") == "basic_kmer_matches":
+        cost *= 2
+    return cost
+
+
+def _schedule_chunks(lengths: List[int], configs: List[dict], tasks: List[Tuple[int, int, int]],
+                     n_workers: int) -> List[List[Tuple[int, int, int]]]:
+    """
+    Pending tasks grouped into chunks, the most expensive pairs first. Each chunk
+    takes about remaining cost / (2 * workers), so chunks shrink towards the end
+    of the run (guided self-scheduling) and no worker is left with a long tail.
+    """
+    costed = [(estimate_pair_cost(lengths[i], lengths[j], configs[m]), m, i, j) for m, i, j in tasks]
+    costed.sort(reverse=True)
+    remaining = sum(cost for cost, _, _, _ in costed)
+    chunks = []
+    chunk, chunk_cost, target = [], 0.0, remaining / (2 * n_workers)
+    for cost, m, i, j in costed:
+        chunk.append((m, i, j))
+        chunk_cost += cost
+        if chunk_cost >= target:
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            chunk, chunk_cost, target = [], 0.0, remaining / (2 * n_workers)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _pending_pairs(N: int, symmetric: bool, completed, shard: Tuple[int, int] = None) -> List[Tuple[int, int]]:
+    """
+    pairs (i, j) still to be computed; with shard = (index, count) only the
+    pairs of that shard, which takes every count-th pair in row order
+    """
+    pairs = []
+    pair_number = 0
+    for i in range(N):
+        for j in range(i + 1 if symmetric else 0, N):
+            if j == i:
+                continue
+            if (shard is None or pair_number % shard[1] == shard[0]) and (i, j) not in completed:
+                pairs.append((i, j))
+            pair_number += 1
+    return pairs
+
+
+def known_distances(names: List[str], phylip_path: str) -> Dict[Tuple[int, int], float]:
+    """
+    Distances between the given sequences that an earlier PHYLIP matrix already
+    holds, matched by (truncated) name; sequences missing from it are new.
+    """
+    old_names, old_matrix = read_phylip(phylip_path)
+    if len(set(old_names)) != len(old_names):
+        raise ValueError(f"{phylip_path} has duplicate names, its rows cannot be matched to sequences")
+    old_index = {name: row for row, name in enumerate(old_names)}
+    rows = [old_index.get(phylip_name(name)) for name in names]
+    if len({phylip_name(name) for name in names}) != len(names):
+        raise ValueError("Sequence names are not unique within their first 10 characters")
+    known = {}
+    for i, row_i in enumerate(rows):
+        for j, row_j in enumerate(rows):
+            if i != j and row_i is not None and row_j is not None:
+                known[(i, j)] = old_matrix[row_i][row_j]
+    n_new = sum(row is None for row in rows)
+    logger.info(f"Extending {phylip_path}: {len(rows) - n_new} known and {n_new} new sequences")
+    return known
+
+
+def build_distance_matrix(seqs: List[str], args: dict, parallel: bool = False,
+                          names: List[str] = None, telemetry: Telemetry = None) -> List[List[float]]:
+    """
+    Distance matrix of all pairs of seqs, the diagonal is 0.
+    The k-mer profile of every sequence is counted once per k and shared by all
+    of its pairs through a ProfileCache (args.profile_cache_mb, 0 turns it off).
+    With parallel=True the pairs are spread over a ProcessPoolExecutor
+    (args.n_workers processes, default all cores) in cost-ordered chunks, the
+    workers read the sequences from a SharedSequenceStore, and every worker
+    process keeps its own cache with an even share of that budget.
+
+    All methods and background methods give d(i, j) == d(j, i), so by default
+    only i < j is computed and mirrored; args.symmetric_matrix = False computes
+    every ordered pair.
+
+    With args.checkpoint_dir every finished pair is appended to a checkpoint
+    file, and a rerun on the same inputs and config skips the pairs found there.
+
+    With args.extend_from set to an earlier PHYLIP output (and the sequence
+    names given), the pairs found in it are reused and only the rows and
+    columns of the new sequences are computed.
+
+    With a Telemetry the stage timings of every pair, from all worker
+    processes, are added to it (see utils/telemetry.py).
+    """
+    return build_distance_matrices(seqs, [args], parallel, names, telemetry)[0]
+
+
+def build_distance_matrices(seqs: List[str], configs: List[dict], parallel: bool = False,
+                            names: List[str] = None, telemetry: Telemetry = None) -> List[List[List[float]]]:
+    """
+    One distance matrix per method config, computed in a single sweep over the
+    pairs: one profile cache (and with parallel=True one process pool) serves
+    every config, so the profiles the configs have in common, such as the basic
+    k-mer background or the seq1 profiles of methods sharing a k-mer filter, are
+    counted only once. Cache and pool settings are taken from the first config,
+    everything else as in build_distance_matrix.
+    """
+    N = len(seqs)
+    matrices = []
+    checkpoints = []
+    tasks = []
+    for m, args in enumerate(configs):
+        symmetric = args.get("symmetric_matrix", True)
+        distance_matrix = [[0.0 for _ in range(N)] for _ in range(N)]
+        checkpoint = open_matrix_checkpoint(seqs, args)
+        completed = dict(checkpoint.completed) if checkpoint is not None else {}
+        if args.get("extend_from", None) and names is not None:
+            completed.update(known_distances(names, args.get("extend_from")))
+        if symmetric:
+            completed.update({(j, i): distance for (i, j), distance in list(completed.items())})
+        for (i, j), distance in completed.items():
+            distance_matrix[i][j] = distance
+        if checkpoint is not None and checkpoint.completed:
+            logger.info(f"Resuming from checkpoint {checkpoint.path} with {len(checkpoint.completed)} finished pairs")
+        matrices.append(distance_matrix)
+        checkpoints.append(checkpoint)
+        tasks.extend((m, i, j) for i, j in _pending_pairs(N, symmetric, completed))
+
+    def store(m: int, i: int, j: int, distance: float) -> None:
+        matrices[m][i][j] = distance
+        if configs[m].get("symmetric_matrix", True):
+            matrices[m][j][i] = distance
+        if checkpoints[m] is not None:
+            checkpoints[m].record(i, j, distance)
+
+    try:
+        _compute_tasks(seqs, configs, tasks, store, parallel, telemetry)
+    finally:
+        for checkpoint in checkpoints:
+            if checkpoint is not None:
+                checkpoint.close()
+    return matrices
+
+
+def _compute_tasks(seqs: List[str], configs: List[dict], tasks: List[Tuple[int, int, int]], store, parallel: bool,
+                   telemetry: Telemetry = None) -> None:
+    """compute the distances of the pending (config, i, j) tasks, handing each to store(m, i, j, distance)"""
+    load_config_pattern_sets(configs)
+    if parallel:
+        _build_parallel(seqs, configs, tasks, store, telemetry)
+        return
+    profile_cache = make_profile_cache(configs[0])
+    for m, i, j in tasks:
+        store(m, i, j, compute_distance(seqs[i], seqs[j], configs[m], profile_cache, (i, j), telemetry))
+    if profile_cache is not None:
+        logger.info(f"Profile cache: {profile_cache.hits} hits, {profile_cache.misses} misses, "
+                    f"{len(profile_cache)} profiles ({profile_cache.nbytes / 2**20:.1f} MB) kept")
+
+
+def _build_parallel(seqs: List[str], configs: List[dict], tasks: List[Tuple[int, int, int]], store,
+                    telemetry: Telemetry = None) -> None:
+    """compute the pending tasks in worker processes, storing every chunk as soon as it is done"""
+    if not tasks:
+        return
+    n_workers = configs[0].get("n_workers", None) or os.cpu_count() or 1
+    chunks = _schedule_chunks([len(sequence) for sequence in seqs], configs, tasks, n_workers)
+    # the sequences go to shared memory once, tasks only carry indices
+    sequences = SharedSequenceStore.create(seqs)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker,
+                initargs=(sequences.name, sequences.offsets, configs, get_log_queue(), telemetry is not None, n_workers)) as executor:
+            # submitted in order, so the workers pick up the expensive chunks first
+            futures = {executor.submit(_distance_chunk, chunk): chunk for chunk in chunks}
+            for future in concurrent.futures.as_completed(futures):
+                distances, stages = future.result()
+                for (m, i, j), distance in zip(futures[future], distances):
+                    store(m, i, j, distance)
+                if stages:
+                    telemetry.merge(stages)
+    finally:
+        sequences.close()
+
+
+def _new_pair_tasks(configs: List[dict], start: int, end: int) -> List[Tuple[int, int, int]]:
+    """tasks of the pairs that sequences start..end-1 add to a matrix of the first start sequences"""
+    tasks = []
+    for m, args in enumerate(configs):
+        if args.get("symmetric_matrix", True):
+            tasks.extend((m, i, j) for j in range(start, end) for i in range(j))
+        else:
+            tasks.extend((m, i, j) for i in range(end) for j in range(end) if i != j and max(i, j) >= start)
+    return tasks
+
+
+def build_distance_matrices_streaming(batches: Iterable[Tuple[List[str], List[str]]], configs: List[dict],
+                                      parallel: bool = False,
+                                      telemetry: Telemetry = None) -> Tuple[List[str], List[List[List[float]]]]:
+    """
+    Names and one distance matrix per config, as build_distance_matrices, for
+    sequences that arrive in batches of (names, sequences), e.g. file by file
+    from iter_sequence_batches_from_multiple_files. The pairs a batch adds are
+    scheduled as soon as it arrives, so the remaining files are loaded while
+    the first distances are computed. Checkpoints and extend_from need the
+    whole dataset up front and are not supported here.
+    """
+    for args in configs:
+        if args.get("checkpoint_dir", None) or args.get("extend_from", None):
+            raise ValueError("checkpoint_dir and extend_from need the whole dataset, use build_distance_matrices")
+    load_config_pattern_sets(configs)
+    names = []
+    distances = [{} for _ in configs]
+    if parallel:
+        n_workers = configs[0].get("n_workers", None) or os.cpu_count() or 1
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_collection_worker,
+            initargs=(dict(configs[0]), get_log_queue(), telemetry is not None, n_workers))
+        # start the workers before the loader threads run, forking a threaded process is unsafe
+        executor.submit(int).result()
+        stores, refs, lengths, futures = [], [], [], {}
+    else:
+        profile_cache = make_profile_cache(configs[0])
+        seqs = []
+    try:
+        for batch_names, batch_seqs in batches:
+            start = len(names)
+            names.extend(batch_names)
+            tasks = _new_pair_tasks(configs, start, len(names))
+            if not parallel:
+                seqs.extend(batch_seqs)
+                for m, i, j in tasks:
+                    distances[m][(i, j)] = compute_distance(seqs[i], seqs[j], configs[m], profile_cache, (i, j), telemetry)
+                continue
+            # every batch gets its own shared memory block, tasks refer to (block, index)
+            stores.append(SharedSequenceStore.create(batch_seqs))
+            refs.extend((stores[-1].name, index) for index in range(len(batch_seqs)))
+            lengths.extend(len(sequence) for sequence in batch_seqs)
+            collections = {store.name: store.offsets for store in stores}
+            for chunk in _schedule_chunks(lengths, configs, tasks, n_workers) if tasks else []:
+                futures[executor.submit(_collection_chunk, collections, list(refs), configs, chunk)] = chunk
+            logger.info(f"Scheduled {len(tasks)} distances for {len(batch_names)} new sequences")
+        if parallel:
+            for future in concurrent.futures.as_completed(futures):
+                chunk_distances, stages = future.result()
+                for (m, i, j), distance in zip(futures[future], chunk_distances):
+                    distances[m][(i, j)] = distance
+                if stages:
+                    telemetry.merge(stages)
+    finally:
+        if parallel:
+            executor.shutdown(cancel_futures=True)
+            for store in stores:
+                store.close()
+
+    N = len(names)
+    matrices = []
+    for args, pair_distances in zip(configs, distances):
+        distance_matrix = [[0.0 for _ in range(N)] for _ in range(N)]
+        for (i, j), distance in pair_distances.items():
+            distance_matrix[i][j] = distance
+            if args.get("symmetric_matrix", True):
+                distance_matrix[j][i] = distance
+        matrices.append(distance_matrix)
+    return names, matrices
+
+
+# Pair-space sharding: the pairs of a dataset are dealt round-robin into
+# shard_count shards, each computed by an independent process (on any node)
+# into its own partial file in args.shard_dir. The partial files use the
+# checkpoint format, so an interrupted shard resumes where it stopped, and
+# merge_matrix_shards assembles the full matrix once all shards are done.
+def shard_path(seqs: List[str], args: dict, shard_index: int, shard_count: int) -> str:
+    """partial result file of one shard"""
+    mode = "sym" if args.get("symmetric_matrix", True) else "full"
+    fingerprint = matrix_fingerprint(seqs, args)[:16]
+    shard_dir = args.get("shard_dir", os.path.join(args.get("output_path", "."), "shards"))
+    return os.path.join(shard_dir, f"matrix_{fingerprint}_{mode}_shard{shard_index}of{shard_count}.tsv")
+
+
+def build_matrix_shard(seqs: List[str], args: dict, shard_index: int, shard_count: int,
+                       parallel: bool = False, telemetry: Telemetry = None) -> str:
+    """compute the pairs of one shard into its partial file, returns the file path"""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index}/{shard_count}")
+    path = shard_path(seqs, args, shard_index, shard_count)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = MatrixCheckpoint(path, matrix_fingerprint(seqs, args))
+    symmetric = args.get("symmetric_matrix", True)
+    pairs = _pending_pairs(len(seqs), symmetric, partial.completed, (shard_index, shard_count))
+    logger.info(f"Shard {shard_index}/{shard_count}: {len(partial.completed)} pairs done, {len(pairs)} to compute")
+    try:
+        _compute_tasks(seqs, [args], [(0, i, j) for i, j in pairs],
+                       lambda m, i, j, distance: partial.record(i, j, distance), parallel, telemetry)
+    finally:
+        partial.close()
+    return path
+
+
+def merge_matrix_shards(seqs: List[str], args: dict, shard_count: int) -> List[List[float]]:
+    """assemble the distance matrix from the partial files of all shards"""
+    N = len(seqs)
+    symmetric = args.get("symmetric_matrix", True)
+    fingerprint = matrix_fingerprint(seqs, args)
+    distance_matrix = [[0.0 for _ in range(N)] for _ in range(N)]
+    for shard_index in range(shard_count):
+        path = shard_path(seqs, args, shard_index, shard_count)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Shard {shard_index}/{shard_count} has no partial file {path}")
+        completed, _ = read_checkpoint(path, fingerprint)
+        missing = _pending_pairs(N, symmetric, completed, (shard_index, shard_count))
+        if missing:
+            raise ValueError(f"Shard {shard_index}/{shard_count} is incomplete, {len(missing)} pairs are missing in {path}")
+        for (i, j), distance in completed.items():
+            distance_matrix[i][j] = distance
+            if symmetric:
+                distance_matrix[j][i] = distance
+    return distance_matrix
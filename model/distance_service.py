@@ -0,0 +1,212 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import socket
+from typing import Dict, List, Tuple
+
+from easydict import EasyDict
+
+from model.distance_matrix import _collection_chunk, _init_collection_worker, _pending_pairs, _schedule_chunks
+from model.sequence_store import SharedSequenceStore
+from utils.file_system import load_sequences_for_evaluation, load_sequences_for_evaluation_from_multiple_files
+from utils.logger import get_log_queue, setup_logger
+from utils.telemetry import make_telemetry
+
+logger = setup_logger()
+
+# Long-running distance service. An asyncio front end accepts JSON requests on a
+# Unix socket or a localhost TCP port, one JSON object per line, and answers each
+# with one line {"ok": true, "result": ...} or {"ok": false, "error": ...}.
+# Loaded genomes stay in shared memory and the back-end process pool stays up,
+# every worker keeping its own ProfileCache, so repeated queries on loaded
+# genomes skip process start-up, FASTA parsing and k-mer counting.
+#
+# Requests:
+#   {"op": "load", "path": <fasta file or directory>, "genome_level": <bool>}   or   {"op": "load", "sequences": {name: sequence}}
+#   {"op": "distance", "a": <name>, "b": <name>, "config": {...}}
+#   {"op": "matrix", "names": [...], "configs": [{...}, ...]}   (names default to all loaded genomes)
+#   {"op": "names"}, {"op": "stats"}, {"op": "shutdown"}
+# A request's config is laid over the config the service was started with, and
+# genome_level (every FASTA file one multi-contig genome) defaults to its genome_level.
+
+
+class DistanceService:
+    def __init__(self, args: dict, n_workers: int = None):
+        """service with the default config args and a pool of n_workers processes (default all cores)"""
+        self.args = args
+        self.n_workers = n_workers or args.get("n_workers", None) or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.n_workers, initializer=_init_collection_worker,
+            initargs=(dict(args), get_log_queue(), bool(args.get("telemetry", False)), self.n_workers))
+        # stage timings of all requests (args.telemetry), reported by the stats request
+        self.telemetry = make_telemetry(args)
+        # every load goes to its own shared memory block, genomes are found by name
+        self.collections = {}
+        self.genomes = {}
+        self.requests = 0
+        self.stopped = asyncio.Event()
+
+    def _config(self, overrides: dict = None) -> EasyDict:
+        return EasyDict({**self.args, **(overrides or {})})
+
+    def _refs(self, names: List[str]) -> List[Tuple[str, int]]:
+        missing = [name for name in names if name not in self.genomes]
+        if missing:
+            raise KeyError(f"Genomes not loaded: {', '.join(missing[:5])}")
+        return [self.genomes[name] for name in names]
+
+    def _offsets_of(self, refs: List[Tuple[str, int]]) -> Dict[str, object]:
+        return {shm_name: self.collections[shm_name].offsets for shm_name in {shm_name for shm_name, _ in refs}}
+
+    def _length(self, ref: Tuple[str, int]) -> int:
+        offsets = self.collections[ref[0]].offsets
+        return int(offsets[ref[1] + 1] - offsets[ref[1]])
+
+    async def load(self, path: str = None, sequences: Dict[str, str] = None, genome_level: bool = None) -> List[str]:
+        """
+        load genomes from a FASTA file or directory, or take them as given; returns their names.
+        With genome_level (default args.genome_level) every FASTA file is one genome.
+        """
+        if genome_level is None:
+            genome_level = self.args.get("genome_level", False)
+        if path is not None:
+            loader = load_sequences_for_evaluation_from_multiple_files if os.path.isdir(path) else load_sequences_for_evaluation
+            names, seqs = await asyncio.to_thread(loader, path, genome_level=genome_level)
+        elif sequences:
+            names, seqs = list(sequences), list(sequences.values())
+        else:
+            raise ValueError("load needs a path or sequences")
+        collection = SharedSequenceStore.create(seqs)
+        self.collections[collection.name] = collection
+        for index, name in enumerate(names):
+            self.genomes[name] = (collection.name, index)
+        logger.info(f"Loaded {len(names)} genomes into {collection.name}")
+        return names
+
+    async def matrices(self, names: List[str], configs: List[dict]) -> List[List[List[float]]]:
+        """one distance matrix of the named genomes per config"""
+        refs = self._refs(names)
+        configs = [self._config(config) for config in configs]
+        N = len(refs)
+        matrices = [[[0.0 for _ in range(N)] for _ in range(N)] for _ in configs]
+        tasks = [(m, i, j) for m, args in enumerate(configs)
+                 for i, j in _pending_pairs(N, args.get("symmetric_matrix", True), {})]
+        if not tasks:
+            return matrices
+        chunks = _schedule_chunks([self._length(ref) for ref in refs], configs, tasks, self.n_workers)
+        loop = asyncio.get_running_loop()
+        collections = self._offsets_of(refs)
+        futures = [loop.run_in_executor(self.executor, _collection_chunk, collections, refs, configs, chunk)
+                   for chunk in chunks]
+        for chunk, (distances, stages) in zip(chunks, await asyncio.gather(*futures)):
+            if stages:
+                self.telemetry.merge(stages)
+            for (m, i, j), distance in zip(chunk, distances):
+                matrices[m][i][j] = distance
+                if configs[m].get("symmetric_matrix", True):
+                    matrices[m][j][i] = distance
+        return matrices
+
+    async def handle(self, request: dict):
+        """result of one request"""
+        op = request.get("op", None)
+        if op == "load":
+            return await self.load(request.get("path", None), request.get("sequences", None), request.get("genome_level", None))
+        if op == "distance":
+            matrices = await self.matrices([request["a"], request["b"]], [request.get("config", None)])
+            return matrices[0][0][1]
+        if op == "matrix":
+            configs = request.get("configs", None) or [request.get("config", None)]
+            names = request.get("names", None) or list(self.genomes)
+            return {"names": names, "matrices": await self.matrices(names, configs)}
+        if op == "names":
+            return list(self.genomes)
+        if op == "stats":
+            stats = {"genomes": len(self.genomes), "collections": len(self.collections),
+                     "workers": self.n_workers, "requests": self.requests}
+            if self.telemetry is not None:
+                stats["telemetry"] = self.telemetry.totals()
+            return stats
+        if op == "shutdown":
+            self.stopped.set()
+            return None
+        raise ValueError(f"Unknown op: {op}")
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while not self.stopped.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                self.requests += 1
+                try:
+                    response = {"ok": True, "result": await self.handle(json.loads(line))}
+                except Exception as e:
+                    logger.error(f"Request failed: {str(e)}", exc_info=True)
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str = None, port: int = None) -> None:
+        """answer requests on socket_path (Unix socket) or on localhost:port until a shutdown request"""
+        # lines carry whole genomes in load requests
+        limit = 1 << 30
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self._serve_connection, path=socket_path, limit=limit)
+            logger.info(f"Distance service listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(self._serve_connection, host="127.0.0.1", port=port, limit=limit)
+            logger.info(f"Distance service listening on 127.0.0.1:{port}")
+        try:
+            await self.stopped.wait()
+        finally:
+            server.close()
+            self.close()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+        for collection in self.collections.values():
+            collection.close()
+        self.collections.clear()
+        self.genomes.clear()
+
+
+class DistanceClient:
+    def __init__(self, socket_path: str = None, port: int = None):
+        """connection to a running DistanceService"""
+        if socket_path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(socket_path)
+        else:
+            self._socket = socket.create_connection(("127.0.0.1", port))
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, op: str, **fields):
+        """send one request and return its result, raising RuntimeError if it failed"""
+        self._file.write((json.dumps({"op": op, **fields}) + "\n").encode())
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def load(self, path: str = None, sequences: Dict[str, str] = None, genome_level: bool = None) -> List[str]:
+        fields = {"path": os.path.abspath(path)} if path is not None else {"sequences": sequences}
+        if genome_level is not None:
+            fields["genome_level"] = genome_level
+        return self.request("load", **fields)
+
+    def distance(self, a: str, b: str, config: dict = None) -> float:
+        return self.request("distance", a=a, b=b, config=config)
+
+    def matrix(self, names: List[str] = None, configs: List[dict] = None) -> dict:
+        return self.request("matrix", names=names, configs=configs)
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
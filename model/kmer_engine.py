@@ -0,0 +1,288 @@
+from collections import Counter, namedtuple
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 2-bit packed k-mer engine
+# Each sequence is encoded once as A=0, C=1, G=2, T=3 (INVALID_BASE for any other
+# character) and every k-mer becomes a rolling uint64 code. Purines (A, G) have
+# an even code and pyrimidines (C, T) an odd one, so the RY class of a base is
+# its lowest bit. Windows touching any other character (N runs, IUPAC codes, the
+# CONTIG_BOUNDARY between the contigs of a genome-level sequence) are not counted
+# at all: valid_window_mask finds them from the runs of invalid bases.
+MAX_PACKED_K = 32
+MAX_CANONICAL_K = 31  # two bits of the 64-bit sort key hold the class weight
+INVALID_BASE = 4
+
+_ENCODE_TABLE = np.full(256, INVALID_BASE, dtype=np.uint8)
+for _code, _base in enumerate("ACGT"):
+    _ENCODE_TABLE[ord(_base)] = _code
+
+_IS_PURINE = np.array([True, False, True, False, False])
+_IS_PYRIMIDINE = np.array([False, True, False, True, False])
+
+KmerFilter = Callable[[np.ndarray, int], np.ndarray]
+
+# sorted unique k-mer codes with their counts. Canonical profiles also carry a
+# per-code `weights` multiplier (see canonical_kmer_profile), plain profiles
+# leave it as None.
+KmerProfile = namedtuple("KmerProfile", ["codes", "counts", "weights"], defaults=[None])
+
+
+def encode_sequence(sequence: str) -> np.ndarray:
+    """encode a DNA sequence into a uint8 array of 2-bit base codes"""
+    raw = np.frombuffer(sequence.encode("latin-1"), dtype=np.uint8)
+    return _ENCODE_TABLE[raw]
+
+
+def spaced_codes(encoded: np.ndarray, offsets: Sequence[int], window_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Roll the bases at `offsets` of every window into a uint64 code.
+
+    Returns the codes of all len(encoded) - window_length + 1 windows and the
+    valid_window_mask of the windows made only of A, C, G and T.
+    """
+    if len(offsets) > MAX_PACKED_K:
+        raise ValueError(f"At most {MAX_PACKED_K} bases fit into a packed code.")
+    n_windows = max(len(encoded) - window_length + 1, 0)
+    codes = np.zeros(n_windows, dtype=np.uint64)
+    for offset in offsets:
+        codes <<= np.uint64(2)
+        codes |= encoded[offset:offset + n_windows] & 3
+    return codes, valid_window_mask(encoded, window_length)
+
+
+def invalid_runs(encoded: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """starts and ends of the runs of invalid (non-ACGT) bases of an encoded sequence"""
+    edges = np.diff(np.concatenate(([0], (encoded == INVALID_BASE).view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def valid_window_mask(encoded: np.ndarray, window_length: int) -> np.ndarray:
+    """
+    mask of the windows of window_length bases that touch no invalid base: every
+    run [start, end) of invalid bases rules out the window starts start - window_length + 1 .. end - 1
+    """
+    n_windows = max(len(encoded) - window_length + 1, 0)
+    starts, ends = invalid_runs(encoded)
+    if len(starts) == 0:
+        return np.ones(n_windows, dtype=bool)
+    cover = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.add.at(cover, np.maximum(starts - window_length + 1, 0), 1)
+    np.add.at(cover, ends, -1)
+    return np.cumsum(cover[:n_windows]) == 0
+
+
+def kmer_codes(encoded: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """rolling uint64 codes of all k-mers and the mask of k-mers made only of ACGT"""
+    return spaced_codes(encoded, list(range(k)), k)
+
+
+def decode_kmer(code: int, k: int) -> str:
+    """convert a packed k-mer code back to its string"""
+    return "".join("ACGT"[(code >> (2 * (k - 1 - i))) & 3] for i in range(k))
+
+
+# k-mer filters: map an encoded sequence to the mask of window starts to keep
+def start_ry_filter(encoded: np.ndarray, k: int) -> np.ndarray:
+    """k-mers starting with a purine followed by a pyrimidine"""
+    n_windows = max(len(encoded) - k + 1, 0)
+    return _IS_PURINE[encoded[:n_windows]] & _IS_PYRIMIDINE[encoded[1:n_windows + 1]]
+
+
+def start_rr_filter(encoded: np.ndarray, k: int) -> np.ndarray:
+    """k-mers starting with two purines"""
+    n_windows = max(len(encoded) - k + 1, 0)
+    return _IS_PURINE[encoded[:n_windows]] & _IS_PURINE[encoded[1:n_windows + 1]]
+
+
+@lru_cache(maxsize=None)
+def compile_ry_lookup(patterns: Tuple[str, ...]) -> np.ndarray:
+    """2^w boolean table indexed by the RY bit-code of a w-base word (R/r = 0, Y/y = 1)"""
+    word_length = len(patterns[0])
+    lookup = np.zeros(1 << word_length, dtype=bool)
+    for pattern in patterns:
+        if len(pattern) != word_length:
+            raise ValueError("All RY patterns of a set must have the same length.")
+        lookup[int(pattern.upper().replace("R", "0").replace("Y", "1"), 2)] = True
+    return lookup
+
+
+def ry_pattern_filter(patterns: List[str]) -> KmerFilter:
+    """k-mers whose RY translation starts with one of `patterns` (R/r = purine, Y/y = pyrimidine)"""
+    lookup = compile_ry_lookup(tuple(patterns))
+    word_length = len(patterns[0])
+
+    def _filter(encoded: np.ndarray, k: int) -> np.ndarray:
+        n_windows = max(len(encoded) - k + 1, 0)
+        n_words = max(len(encoded) - word_length + 1, 0)
+        # rolling RY bit-code of every word, then one gather from the lookup table
+        ry_codes = np.zeros(n_words, dtype=np.intp)
+        valid = np.ones(n_words, dtype=bool)
+        for offset in range(word_length):
+            bases = encoded[offset:offset + n_words]
+            ry_codes <<= 1
+            ry_codes |= bases & 1
+            valid &= bases != INVALID_BASE
+        keep = valid & lookup[ry_codes]
+        # windows whose pattern runs past the end of the sequence never match
+        mask = np.zeros(n_windows, dtype=bool)
+        shared = min(n_windows, n_words)
+        mask[:shared] = keep[:shared]
+        return mask
+
+    return _filter
+
+
+def _count_windows(sequences: List[str], window_length: int, offsets: List[int],
+                   kmer_filter: Optional[KmerFilter]) -> Counter:
+    counts = Counter()
+    for sequence in sequences:
+        encoded = encode_sequence(sequence)
+        codes, valid = spaced_codes(encoded, offsets, window_length)
+        if kmer_filter is not None:
+            valid &= kmer_filter(encoded, window_length)
+        counts.update(codes[valid].tolist())
+    return counts
+
+
+def count_kmers_packed(sequences: List[str], k: int, kmer_filter: Optional[KmerFilter] = None) -> Counter:
+    """calculate k-mer frequencies on packed codes, optionally keeping only filtered k-mers"""
+    return _count_windows(sequences, k, list(range(k)), kmer_filter)
+
+
+@lru_cache(maxsize=None)
+def compile_spaced_seed(pattern: str) -> Tuple[Tuple[int, ...], int]:
+    """match offsets and window length of a binary seed pattern, compiled once per pattern"""
+    offsets = tuple(j for j, care in enumerate(pattern) if care == '1')
+    if len(offsets) > MAX_PACKED_K:
+        raise ValueError(f"At most {MAX_PACKED_K} bases fit into a packed code.")
+    return offsets, len(pattern)
+
+
+def count_spaced_words_packed(sequences: List[str], pattern: str) -> Counter:
+    """calculate spaced-word frequencies on packed codes, pattern is a binary string"""
+    offsets, window_length = compile_spaced_seed(pattern)
+    return _count_windows(sequences, window_length, offsets, None)
+
+
+# NumPy backend: per-sequence profiles from np.unique and sorted-merge reductions
+def _profile_windows(sequences: List[str], window_length: int, offsets: List[int],
+                     kmer_filter: Optional[KmerFilter]) -> KmerProfile:
+    code_chunks = [np.zeros(0, dtype=np.uint64)]
+    for sequence in sequences:
+        encoded = encode_sequence(sequence)
+        codes, valid = spaced_codes(encoded, offsets, window_length)
+        if kmer_filter is not None:
+            valid &= kmer_filter(encoded, window_length)
+        code_chunks.append(codes[valid])
+    codes, counts = np.unique(np.concatenate(code_chunks), return_counts=True)
+    return KmerProfile(codes, counts.astype(np.int64))
+
+
+def kmer_profile(sequences: List[str], k: int, kmer_filter: Optional[KmerFilter] = None) -> KmerProfile:
+    """sorted k-mer codes and counts of the given sequences"""
+    return _profile_windows(sequences, k, list(range(k)), kmer_filter)
+
+
+def spaced_word_profile(sequences: List[str], pattern: str) -> KmerProfile:
+    """sorted spaced-word codes and counts of the given sequences"""
+    return spaced_word_profiles(sequences, [pattern])[0]
+
+
+def spaced_word_profiles(sequences: List[str], patterns: List[str]) -> List[KmerProfile]:
+    """one profile per seed pattern, every sequence is encoded only once for all seeds"""
+    seeds = [compile_spaced_seed(pattern) for pattern in patterns]
+    code_chunks = [[np.zeros(0, dtype=np.uint64)] for _ in seeds]
+    for sequence in sequences:
+        encoded = encode_sequence(sequence)
+        for (offsets, window_length), chunks in zip(seeds, code_chunks):
+            codes, valid = spaced_codes(encoded, offsets, window_length)
+            chunks.append(codes[valid])
+    profiles = []
+    for chunks in code_chunks:
+        codes, counts = np.unique(np.concatenate(chunks), return_counts=True)
+        profiles.append(KmerProfile(codes, counts.astype(np.int64)))
+    return profiles
+
+
+def _shared_counts(profile1: KmerProfile, profile2: KmerProfile):
+    _, index1, index2 = np.intersect1d(profile1.codes, profile2.codes, assume_unique=True, return_indices=True)
+    weights = None if profile1.weights is None else profile1.weights[index1]
+    return profile1.counts[index1], profile2.counts[index2], weights
+
+
+def product_matches(profile1: KmerProfile, profile2: KmerProfile) -> int:
+    """sum of count1 * count2 over the k-mers shared by two profiles"""
+    counts1, counts2, weights = _shared_counts(profile1, profile2)
+    if weights is not None:
+        counts1 = counts1 * weights
+    return int(np.dot(counts1, counts2))
+
+
+def min_matches(profile1: KmerProfile, profile2: KmerProfile) -> float:
+    """0.5 * sum of min(count1, count2) over the k-mers shared by two profiles"""
+    counts1, counts2, weights = _shared_counts(profile1, profile2)
+    shared = np.minimum(counts1, counts2)
+    if weights is not None:
+        shared = shared * weights
+    return 0.5 * int(shared.sum())
+
+
+# Canonical k-mers: count min(code, revcomp(code)) over the forward strand only.
+# With C(m) the canonical count, the two-strand counts of the string path are
+# c(x) = c(rc x) = C(m) for non-palindromic x and c(m) = 2 C(m) for palindromes,
+# so the two-strand results are recovered exactly by a per-class weight:
+#   sum_x c1(x) * c2(x)            = sum_m C1(m) * C2(m) * (1 + [m is a palindrome])
+#   sum_x 0.5 * min(c1(x), c2(x))  = sum_m 0.5 * (F(m) + F(rc m)) * min(C1(m), C2(m))
+# where F is the k-mer filter of the method (1 for every k-mer when unfiltered).
+def reverse_complement_encoded(encoded: np.ndarray) -> np.ndarray:
+    """reverse complement of an encoded sequence, invalid bases stay invalid"""
+    reverse = encoded[::-1]
+    return np.where(reverse == INVALID_BASE, INVALID_BASE, 3 - reverse).astype(np.uint8)
+
+
+def reverse_complement_codes(encoded: np.ndarray, k: int) -> np.ndarray:
+    """rolling uint64 codes of the reverse complement of every k-mer"""
+    n_windows = max(len(encoded) - k + 1, 0)
+    complement = (3 - encoded) & 3
+    codes = np.zeros(n_windows, dtype=np.uint64)
+    for offset in range(k - 1, -1, -1):
+        codes <<= np.uint64(2)
+        codes |= complement[offset:offset + n_windows]
+    return codes
+
+
+def canonical_kmer_profile(sequence: str, k: int, kmer_filter: Optional[KmerFilter] = None,
+                           product_form: bool = False) -> KmerProfile:
+    """
+    Canonical k-mer profile of one forward strand, standing in for [sequence, reverse_complement(sequence)].
+
+    product_form selects the weights of the sum(c1*c2) reduction (unfiltered only),
+    otherwise the weights of the 0.5*sum(min(c1, c2)) reduction are stored.
+    """
+    if product_form and kmer_filter is not None:
+        raise ValueError("Canonical product-form profiles do not support k-mer filters.")
+    if k > MAX_CANONICAL_K:
+        raise ValueError(f"Canonical profiles need k <= {MAX_CANONICAL_K}.")
+    encoded = encode_sequence(sequence)
+    codes, valid = kmer_codes(encoded, k)
+    reverse_codes = reverse_complement_codes(encoded, k)
+    if kmer_filter is None:
+        forward = np.ones(len(codes), dtype=bool)
+        backward = forward
+    else:
+        forward = kmer_filter(encoded, k)
+        backward = kmer_filter(reverse_complement_encoded(encoded), k)[::-1]
+    if product_form:
+        weights = 1 + (codes == reverse_codes).astype(np.uint8)
+    else:
+        weights = forward.astype(np.uint8) + backward.astype(np.uint8)
+    keep = valid & (weights > 0)
+    # the weight is the same for every window of a class, so it rides along in
+    # the two low bits of the sort key and a plain np.unique is enough
+    keys = np.minimum(codes, reverse_codes)[keep] << np.uint64(2)
+    keys |= weights[keep].astype(np.uint64)
+    keys, counts = np.unique(keys, return_counts=True)
+    return KmerProfile(keys >> np.uint64(2), counts.astype(np.int64), (keys & np.uint64(3)).astype(np.int64))
@@ -0,0 +1,85 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from model.profile_store import sequence_hash
+
+# Append-only checkpoint of a distance-matrix build. Every finished pair is
+# written as one "i<TAB>j<TAB>distance" line and flushed right away, so a run that
+# crashes or gets pre-empted keeps its work. The file is named by a fingerprint
+# of the inputs and of the config keys that change distances, so a rerun with the
+# same config and sequences finds it and skips the pairs it already holds.
+# CHECKPOINT_VERSION is hashed in as well and bumped whenever the distances of
+# the same inputs change (2: windows touching non-ACGT bases are not counted).
+CHECKPOINT_VERSION = 2
+
+# config keys that do not change any distance
+_NON_RESULT_KEYS = {
+    "data_path", "output_path", "checkpoint_dir", "profile_cache_mb", "profile_store_path",
+    "kmer_backend", "symmetric_matrix", "extend_from", "shard_dir", "n_workers", "genome_level", "telemetry", "k_show_values", "name", "description",
+}
+
+
+def matrix_fingerprint(seqs: List[str], args: dict) -> str:
+    """hash of the sequences (in order) and of every distance-relevant config value"""
+    digest = hashlib.sha1(f"version={CHECKPOINT_VERSION}\n".encode())
+    for key in sorted(args):
+        if key not in _NON_RESULT_KEYS:
+            digest.update(f"{key}={args[key]!r}\n".encode())
+    for sequence in seqs:
+        digest.update(sequence_hash(sequence).encode())
+    return digest.hexdigest()
+
+
+def read_checkpoint(path: str, fingerprint: str) -> Tuple[Dict[Tuple[int, int], float], bool]:
+    """
+    finished pairs of a checkpoint file (none if it belongs to other inputs),
+    and whether its last line was cut off
+    """
+    completed = {}
+    torn = False
+    if not os.path.exists(path):
+        return completed, torn
+    with open(path) as f:
+        if f.readline() != f"# fingerprint {fingerprint}\n":
+            return completed, torn
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            # a line cut off by a crash is simply computed again
+            torn = not line.endswith("\n")
+            if len(fields) != 3 or torn:
+                continue
+            completed[(int(fields[0]), int(fields[1]))] = float(fields[2])
+    return completed, torn
+
+
+class MatrixCheckpoint:
+    def __init__(self, path: str, fingerprint: str):
+        """open the checkpoint at path, or start a new one if it belongs to other inputs"""
+        self.path = path
+        self.completed, torn = read_checkpoint(path, fingerprint)
+        if self.completed:
+            self._file = open(path, "a")
+            if torn:
+                self._file.write("\n")
+        else:
+            self._file = open(path, "w")
+            self._file.write(f"# fingerprint {fingerprint}\n")
+            self._file.flush()
+
+    def record(self, i: int, j: int, distance: float) -> None:
+        self._file.write(f"{i}\t{j}\t{float(distance)!r}\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def open_matrix_checkpoint(seqs: List[str], args: dict) -> Optional[MatrixCheckpoint]:
+    """checkpoint of this run in args.checkpoint_dir, None when checkpointing is off"""
+    checkpoint_dir = args.get("checkpoint_dir", None)
+    if not checkpoint_dir:
+        return None
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    fingerprint = matrix_fingerprint(seqs, args)
+    return MatrixCheckpoint(os.path.join(checkpoint_dir, f"matrix_{fingerprint[:16]}.ckpt"), fingerprint)
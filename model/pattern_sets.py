@@ -0,0 +1,99 @@
+import os
+from functools import lru_cache
+from typing import Dict, List
+
+import yaml
+
+from model.kmer_engine import KmerFilter, ry_pattern_filter
+
+# Registry of RY pattern sets. The built-in sets (4_6, 4_9, push, pull) are read
+# from config/ry_pattern_sets.yaml; more sets can be loaded from other files or
+# registered directly, and each set is compiled into its lookup-table filter once
+# per process. The pattern_set_path files of method configs are registered by the
+# matrix builders and their pool initializers through load_config_pattern_sets,
+# once per file and process.
+DEFAULT_PATTERN_SET_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), os.pardir, "config", "ry_pattern_sets.yaml"))
+
+_pattern_sets: Dict[str, List[str]] = {}
+_defaults_loaded = False
+# pattern sets of every pattern_set_path file registered so far, by absolute path
+_config_pattern_files: Dict[str, Dict[str, List[str]]] = {}
+
+
+def register_pattern_set(name: str, patterns: List[str]) -> None:
+    """add or replace a pattern set, all patterns must be R/Y words of one length"""
+    patterns = [str(pattern) for pattern in patterns]
+    if not patterns:
+        raise ValueError(f"Pattern set {name} is empty.")
+    if len({len(pattern) for pattern in patterns}) != 1:
+        raise ValueError(f"Patterns of set {name} must all have the same length.")
+    if any(set(pattern.upper()) - {"R", "Y"} for pattern in patterns):
+        raise ValueError(f"Patterns of set {name} may only contain R and Y.")
+    if _pattern_sets.get(str(name)) != patterns:
+        _pattern_sets[str(name)] = patterns
+        get_pattern_filter.cache_clear()
+
+
+def load_pattern_sets(path: str = DEFAULT_PATTERN_SET_PATH) -> List[str]:
+    """register every pattern set of a YAML file mapping set names to pattern lists"""
+    global _defaults_loaded
+    if os.path.abspath(path) == DEFAULT_PATTERN_SET_PATH:
+        _defaults_loaded = True
+    else:
+        _ensure_loaded()
+    with open(path) as f:
+        pattern_sets = yaml.safe_load(f) or {}
+    for name, patterns in pattern_sets.items():
+        register_pattern_set(name, patterns)
+    return [str(name) for name in pattern_sets]
+
+
+def load_config_pattern_sets(configs: List[dict]) -> None:
+    """
+    register the pattern sets of the pattern_set_path of every config, reading each
+    file only once per process; two files defining the same set name differently
+    cannot be used together, since sets are looked up by name
+    """
+    for args in configs:
+        path = args.get("pattern_set_path", None)
+        if not path or os.path.abspath(path) in _config_pattern_files:
+            continue
+        path = os.path.abspath(path)
+        with open(path) as f:
+            pattern_sets = {str(name): [str(pattern) for pattern in patterns]
+                            for name, patterns in (yaml.safe_load(f) or {}).items()}
+        for other_path, other_sets in _config_pattern_files.items():
+            for name, patterns in pattern_sets.items():
+                if name in other_sets and other_sets[name] != patterns:
+                    raise ValueError(f"Pattern set {name} is defined differently in {path} and {other_path}")
+        load_pattern_sets(path)
+        _config_pattern_files[path] = pattern_sets
+
+
+def _ensure_loaded() -> None:
+    if not _defaults_loaded:
+        load_pattern_sets(DEFAULT_PATTERN_SET_PATH)
+
+
+def available_pattern_sets() -> List[str]:
+    _ensure_loaded()
+    return sorted(_pattern_sets)
+
+
+def get_pattern_set(name: str) -> List[str]:
+    _ensure_loaded()
+    if name not in _pattern_sets:
+        raise ValueError(f"Unknown RY pattern set: {name}")
+    return _pattern_sets[name]
+
+
+def pattern_word_length(name: str) -> int:
+    """length of the RY prefix checked by a pattern set, k has to be at least this"""
+    return len(get_pattern_set(name)[0])
+
+
+@lru_cache(maxsize=None)
+def get_pattern_filter(name: str) -> KmerFilter:
+    """compiled k-mer filter of a pattern set"""
+    return ry_pattern_filter(get_pattern_set(name))
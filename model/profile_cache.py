@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from model.kmer_engine import KmerProfile
+
+# Per-sequence k-mer profile cache for all-pairs distance matrices. The matrix
+# builders hand one cache to every compute_distance call, so the profile of a
+# genome for a given (k, method, strand role) is counted once and reused for all
+# the pairs it takes part in. Least recently used profiles are evicted once the
+# cached arrays exceed the memory budget. profile_cache_mb is the budget of the
+# whole run: a process pool splits it evenly, each worker process gets
+# profile_cache_mb / n_workers for its own cache.
+
+def profile_nbytes(profile: KmerProfile) -> int:
+    """approximate memory held by a profile"""
+    nbytes = profile.codes.nbytes + profile.counts.nbytes
+    if profile.weights is not None:
+        nbytes += profile.weights.nbytes
+    return nbytes
+
+
+class ProfileCache:
+    def __init__(self, max_bytes: int):
+        """LRU cache of KmerProfiles holding at most max_bytes of profile data"""
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._profiles = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def get(self, key: Hashable, build: Callable[[], KmerProfile]) -> KmerProfile:
+        """cached profile of key, built by build() and stored on a miss"""
+        if key in self._profiles:
+            self.hits += 1
+            self._profiles.move_to_end(key)
+            return self._profiles[key][0]
+        self.misses += 1
+        profile = build()
+        nbytes = profile_nbytes(profile)
+        if nbytes <= self.max_bytes:
+            self._profiles[key] = (profile, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._profiles.popitem(last=False)
+                self.nbytes -= evicted
+        return profile
+
+    def clear(self) -> None:
+        self._profiles.clear()
+        self.nbytes = 0
+
+
+def make_profile_cache(args: dict, n_processes: int = 1):
+    """
+    profile cache of one of n_processes processes sharing args.profile_cache_mb,
+    None when caching is turned off
+    """
+    budget_mb = args.get("profile_cache_mb", 512)
+    if not budget_mb or budget_mb <= 0:
+        return None
+    return ProfileCache(int(budget_mb * 1024 * 1024 / max(n_processes, 1)))
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Callable, Optional
+
+import numpy as np
+
+from model.kmer_engine import KmerProfile
+
+# Persistent on-disk k-mer profile store. Every profile lives in its own
+# directory named by a content hash of the sequence and a hash of the counting
+# parameters (k, method, pattern set, strand role, ...), holding the sorted codes
+# and counts (and canonical weights) as .npy files. Profiles are loaded as
+# read-only memmaps, so a re-run with the same sequences and method (e.g. with
+# another background_matches_method) only pays for the intersections.
+# Version 2: windows touching non-ACGT bases are no longer counted.
+STORE_VERSION = 2
+
+
+def sequence_hash(sequence: str) -> str:
+    """content hash of a sequence"""
+    return hashlib.sha1(sequence.encode("latin-1")).hexdigest()
+
+
+class ProfileStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, seq_hash: str, params: tuple) -> str:
+        params_hash = hashlib.sha1(repr((STORE_VERSION,) + tuple(params)).encode()).hexdigest()[:16]
+        return os.path.join(self.root, seq_hash[:2], f"{seq_hash}_{params_hash}")
+
+    def load(self, seq_hash: str, params: tuple) -> Optional[KmerProfile]:
+        """stored profile as read-only memmaps, None if it has not been stored yet"""
+        path = self._path(seq_hash, params)
+        if not os.path.isdir(path):
+            return None
+        codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r")
+        weights = None
+        if os.path.exists(os.path.join(path, "weights.npy")):
+            weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+        return KmerProfile(codes, counts, weights)
+
+    def save(self, seq_hash: str, params: tuple, profile: KmerProfile) -> None:
+        path = self._path(seq_hash, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write into a temporary directory first so that concurrent runs never see half a profile
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        np.save(os.path.join(tmp_path, "codes.npy"), np.asarray(profile.codes))
+        np.save(os.path.join(tmp_path, "counts.npy"), np.asarray(profile.counts))
+        if profile.weights is not None:
+            np.save(os.path.join(tmp_path, "weights.npy"), np.asarray(profile.weights))
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process stored the same profile in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def get(self, seq_hash: str, params: tuple, build: Callable[[], KmerProfile]) -> KmerProfile:
+        """stored profile, built by build() and stored first if missing"""
+        profile = self.load(seq_hash, params)
+        if profile is None:
+            self.save(seq_hash, params, build())
+            profile = self.load(seq_hash, params)
+        return profile
+
+
+def open_profile_store(args: dict) -> Optional[ProfileStore]:
+    """profile store at args.profile_store_path, None when no path is configured"""
+    root = args.get("profile_store_path", None)
+    return ProfileStore(root) if root else None
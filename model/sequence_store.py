@@ -0,0 +1,60 @@
+from multiprocessing import resource_tracker, shared_memory
+from typing import List
+
+import numpy as np
+
+# Sequences of a dataset in one multiprocessing.shared_memory block, so that the
+# worker processes of a matrix build attach to them once (through the pool
+# initializer) instead of receiving pickled genomes with every task. The bases
+# are kept as raw bytes, which hand the workers back every sequence exactly: its
+# length (which sets the k range and the static background) and the
+# CONTIG_BOUNDARY separators of genome-level sequences. Windows touching non-ACGT
+# bases are not counted by any engine, so 2-bit codes plus the lengths and the
+# invalid runs would be enough; raw bytes just keep attaching a plain decode.
+
+
+class SharedSequenceStore:
+    def __init__(self, shm: shared_memory.SharedMemory, offsets: np.ndarray, owner: bool):
+        self.shm = shm
+        self.offsets = offsets
+        self.owner = owner
+
+    @classmethod
+    def create(cls, seqs: List[str]) -> "SharedSequenceStore":
+        """copy the sequences into a new shared memory block"""
+        raw = [sequence.encode("latin-1") for sequence in seqs]
+        offsets = np.zeros(len(raw) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(sequence) for sequence in raw])
+        shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+        for start, sequence in zip(offsets[:-1], raw):
+            shm.buf[start:start + len(sequence)] = sequence
+        return cls(shm, offsets, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, offsets: np.ndarray) -> "SharedSequenceStore":
+        """attach to a block created by another process, without taking ownership of it"""
+        # only the creating process may unlink the block, so attaching must not register
+        # it with the resource tracker (before Python 3.13 SharedMemory always does)
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+        return cls(shm, offsets, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.shm.buf[start:end]).decode("latin-1")
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
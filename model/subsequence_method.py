@@ -2,14 +2,55 @@ import random
 from collections import Counter
 from typing import List
 
+import numpy as np
+
 from utils.sequence_tool import *
+from model.kmer_engine import *
+from model.pattern_sets import get_pattern_filter, pattern_word_length
+from utils.telemetry import Telemetry, measure
+
+# k-mer counting backends: "string" slices every k-mer into a str key, "packed"
+# counts rolling 2-bit integer codes and "numpy" reduces sorted code arrays;
+# all of them give identical match numbers. "canonical" is "numpy" counting
+# canonical k-mers on the forward strand instead of materializing reverse
+# complements when both strands are used. "suffix_array" answers all k of a
+# pair from one index (see F_k_funtion); a single k falls back to "numpy".
+KMER_BACKENDS = ("string", "packed", "numpy", "canonical", "suffix_array")
+
+def _check_backend(backend: str) -> None:
+    if backend not in KMER_BACKENDS:
+        raise ValueError(f"Invalid k-mer backend: {backend}")
+
+def use_packed_backend(backend: str, k: int) -> bool:
+    """whether k-mers of length k are counted on packed codes"""
+    _check_backend(backend)
+    return backend == "packed" and k <= MAX_PACKED_K
+
+def use_numpy_backend(backend: str, k: int) -> bool:
+    """whether k-mers of length k are counted and matched on sorted code arrays"""
+    _check_backend(backend)
+    return backend in ("numpy", "canonical", "suffix_array") and k <= MAX_PACKED_K
+
+def use_canonical_backend(backend: str, k: int, single_seq: bool) -> bool:
+    """whether both strands are counted as canonical k-mers of the forward strand"""
+    _check_backend(backend)
+    return backend == "canonical" and k <= MAX_CANONICAL_K and single_seq != 1
 
 # 0. tools
+_DELETE_ACGT = str.maketrans("", "", "ACGT")
+
+def drop_invalid_kmers(counts: Counter, sequences: List[str]) -> Counter:
+    """remove the k-mers holding non-ACGT characters (N runs, IUPAC codes, contig boundaries)"""
+    if any(sequence.translate(_DELETE_ACGT) for sequence in sequences):
+        for kmer in [kmer for kmer in counts if kmer.translate(_DELETE_ACGT)]:
+            del counts[kmer]
+    return counts
+
 def count_kmers(sequences: List[str], k: int) -> Counter:
     """calculate k-mer frequencies in a given sequence"""
     kmers = [sequence[i:i+k] for sequence in sequences for i in range(len(sequence) - k + 1)]
     # kmers = s[i:i+k] for s in sequences for i in range(len(s) - k + 1)
-    return Counter(kmers)
+    return drop_invalid_kmers(Counter(kmers), sequences)
 
 def count_kmers_start_ry(sequences: List[str], k: int) -> Counter:
     """calculate k-mer frequencies in a given sequence"""
@@ -21,7 +62,7 @@ def count_kmers_start_ry(sequences: List[str], k: int) -> Counter:
             kmer = sequence[i:i + k]  
             if kmer[0] in purines and kmer[1] in pyrimidines:
                 kmers.append(kmer)
-    return Counter(kmers)
+    return drop_invalid_kmers(Counter(kmers), sequences)
 
 def count_kmers_start_rr(sequences: List[str], k: int) -> Counter:
     """计算以两个嘌呤（A或G）开头的k-mer频率"""
@@ -33,348 +74,44 @@ def count_kmers_start_rr(sequences: List[str], k: int) -> Counter:
             # 检查前两个碱基是否为嘌呤
             if kmer[0] in purines and kmer[1] in purines:
                 kmers.append(kmer)
-    return Counter(kmers)
-
-# def count_kmers_start_ry_4_6(sequences: List[str], k: int) -> Counter:
-#     """计算以特定 RY46 模式开头的 k-mer 频率"""
-#     patterns = [
-#         'RRRRRY', 'RRYRRY', 'RRYRYY', 'RYRRRR', 'RYRRRY',
-#         'RYRYRY', 'RYYRRR', 'RYYRRY', 'RYYRYR', 'RYYRYY',
-#         'RYYYRY', 'RYYYYY', 'YRYRRY', 'YYYRRR', 'YYYRRY',
-#         'YYYYRY'
-#     ]
-#     purines = {'A', 'G'}
-#     pyrimidines = {'C', 'T'}
-#     kmers = []
-#     for sequence in sequences:
-#         for i in range(len(sequence) - k + 1):
-#             kmer = sequence[i:i + k]
-#             # Convert kmer to RY pattern
-#             ry_pattern = ''.join(['R' if base in purines else 'Y' for base in kmer])
-#             # Check if the k-mer starts with any of the patterns
-#             if any(ry_pattern.startswith(pattern) for pattern in patterns):
-#                 kmers.append(kmer)
-#     return Counter(kmers)
+    return drop_invalid_kmers(Counter(kmers), sequences)
 
+def count_kmers_start_pattern(sequences: List[str], k: int, pattern_set: str):
+    """yield the k-mers whose RY translation starts with a pattern of `pattern_set`"""
+    kmer_filter = get_pattern_filter(pattern_set)
+    for sequence in sequences:
+        # RY prefixes are checked with one lookup-table gather per sequence
+        encoded = encode_sequence(sequence)
+        selected = kmer_filter(encoded, k) & valid_window_mask(encoded, k)
+        for i in np.flatnonzero(selected).tolist():
+            yield sequence[i:i + k]
 
 def count_kmers_start_ry_4_6(sequences: List[str], k: int) -> Counter:
     """计算以特定 RY46 模式开头的 k-mer 频率"""
-    patterns = [
-        'RRRRRY', 'RRYRRY', 'RRYRYY', 'RYRRRR', 'RYRRRY',
-        'RYRYRY', 'RYYRRR', 'RYYRRY', 'RYYRYR', 'RYYRYY',
-        'RYYYRY', 'RYYYYY', 'YRYRRY', 'YYYRRR', 'YYYRRY',
-        'YYYYRY'
-    ]
-    table = str.maketrans("ACGT", "RYRY")
-    word_length = len(next(iter(patterns)))
-
-    for sequence in sequences:
-        ry_sequence = sequence.translate(table)
-        for i in range(len(sequence) - k + 1):
-            ry_pattern = ry_sequence[i:i + word_length]
-            if ry_pattern in patterns:
-                yield sequence[i:i + k]
-
-
-
-# def count_kmers_start_ry_4_9(sequences: List[str], k: int) -> Counter:
-#     """计算以特定 RY49 模式开头的 k-mer 频率"""
-#     patterns = [
-#         'rrrrrrrry', 'rrrrrryry', 'rrrrryrrr', 'rrrrryrry',
-#         'rrrrryyrr', 'rrrrryyry', 'rrrrryyyr', 'rrrrryyyy',
-#         'rrryryrrr', 'rrryryrry', 'rrryryyrr', 'rrryryyry',
-#         'rrryryyyr', 'rrryryyyy', 'rryrrrrrr', 'rryrrrrry',
-#         'rryrrryry', 'rryrryrrr', 'rryrryrry', 'rryrryryr',
-#         'rryrryyrr', 'rryrryyry', 'rryrryyyy', 'rryryryry',
-#         'rryyryrrr', 'rryyryrry', 'rryyryyry', 'rryyryyyy',
-#         'rryyyyrrr', 'rryyyyrry', 'rryyyyryr', 'rryyyyyrr',
-#         'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrrryyy',
-#         'ryrrryrrr', 'ryrrryrry', 'ryrrryyrr', 'ryrrryyry',
-#         'ryrrryyyr', 'ryrrryyyy', 'ryrryryyr', 'ryrryryyy',
-#         'ryrryyyrr', 'ryrryyyry', 'ryryryrrr', 'ryryryrry',
-#         'ryryryyrr', 'ryryryyry', 'ryryryyyr', 'ryryryyyy',
-#         'ryyrrrrrr', 'ryyrrrrry', 'ryyrrrryr', 'ryyrrryrr',
-#         'ryyrrryry', 'ryyrrryyr', 'ryyrrryyy', 'ryyrryrrr',
-#         'ryyrryrry', 'ryyrryryr', 'ryyrryyrr', 'ryyrryyry',
-#         'ryyrryyyr', 'ryyrryyyy', 'ryyryryrr', 'ryyryryry',
-#         'ryyryryyr', 'ryyryryyy', 'ryyryyrrr', 'ryyryyrry',
-#         'ryyryyyrr', 'ryyryyyry', 'ryyyryrrr', 'ryyyryrry',
-#         'ryyyryyrr', 'ryyyryyry', 'ryyyryyyr', 'ryyyryyyy',
-#         'ryyyyryyr', 'ryyyyryyy', 'ryyyyyryr', 'ryyyyyyrr',
-#         'ryyyyyyyy', 'yryrrrrrr', 'yryrrrrry', 'yryrrryry',
-#         'yryrryrrr', 'yryrryrry', 'yryrryryr', 'yryrryyrr',
-#         'yryrryyry', 'yryrryyyy', 'yryyryrrr', 'yryyryrry',
-#         'yryyryyry', 'yryyryyyy', 'yryyyyrrr', 'yryyyyrry',
-#         'yryyyyryr', 'yryyyyyrr', 'yyrrrryyr', 'yyrrrryyy',
-#         'yyrryryyr', 'yyrryryyy', 'yyyrrrrrr', 'yyyrrrrry',
-#         'yyyrrrryr', 'yyyrrryrr', 'yyyrrryry', 'yyyrrryyr',
-#         'yyyrrryyy', 'yyyrryrrr', 'yyyrryrry', 'yyyrryryr',
-#         'yyyrryyrr', 'yyyrryyry', 'yyyrryyyr', 'yyyrryyyy',
-#         'yyyryryrr', 'yyyryryry', 'yyyryryyr', 'yyyryryyy',
-#         'yyyyyryyr', 'yyyyyryyy', 'yyyyyyryr', 'yyyyyyyrr'
-#     ]
-#     purines = {'A', 'G'}
-#     pyrimidines = {'C', 'T'}
-#     kmers = []
-#     for sequence in sequences:
-#         for i in range(len(sequence) - k + 1):
-#             kmer = sequence[i:i + k]
-#             # Convert kmer to RY pattern
-#             ry_pattern = ''.join(['r' if base in purines else 'y' for base in kmer])
-#             # Check if the k-mer starts with any of the patterns
-#             if any(ry_pattern.startswith(pattern) for pattern in patterns):
-#                 kmers.append(kmer)
-#     return Counter(kmers)
+    return count_kmers_start_pattern(sequences, k, "4_6")
 
 def count_kmers_start_ry_4_9(sequences: List[str], k: int) -> Counter:
     """计算以特定 RY49 模式开头的 k-mer 频率"""
-    patterns = [
-        'rrrrrrrry', 'rrrrrryry', 'rrrrryrrr', 'rrrrryrry',
-        'rrrrryyrr', 'rrrrryyry', 'rrrrryyyr', 'rrrrryyyy',
-        'rrryryrrr', 'rrryryrry', 'rrryryyrr', 'rrryryyry',
-        'rrryryyyr', 'rrryryyyy', 'rryrrrrrr', 'rryrrrrry',
-        'rryrrryry', 'rryrryrrr', 'rryrryrry', 'rryrryryr',
-        'rryrryyrr', 'rryrryyry', 'rryrryyyy', 'rryryryry',
-        'rryyryrrr', 'rryyryrry', 'rryyryyry', 'rryyryyyy',
-        'rryyyyrrr', 'rryyyyrry', 'rryyyyryr', 'rryyyyyrr',
-        'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrrryyy',
-        'ryrrryrrr', 'ryrrryrry', 'ryrrryyrr', 'ryrrryyry',
-        'ryrrryyyr', 'ryrrryyyy', 'ryrryryyr', 'ryrryryyy',
-        'ryrryyyrr', 'ryrryyyry', 'ryryryrrr', 'ryryryrry',
-        'ryryryyrr', 'ryryryyry', 'ryryryyyr', 'ryryryyyy',
-        'ryyrrrrrr', 'ryyrrrrry', 'ryyrrrryr', 'ryyrrryrr',
-        'ryyrrryry', 'ryyrrryyr', 'ryyrrryyy', 'ryyrryrrr',
-        'ryyrryrry', 'ryyrryryr', 'ryyrryyrr', 'ryyrryyry',
-        'ryyrryyyr', 'ryyrryyyy', 'ryyryryrr', 'ryyryryry',
-        'ryyryryyr', 'ryyryryyy', 'ryyryyrrr', 'ryyryyrry',
-        'ryyryyyrr', 'ryyryyyry', 'ryyyryrrr', 'ryyyryrry',
-        'ryyyryyrr', 'ryyyryyry', 'ryyyryyyr', 'ryyyryyyy',
-        'ryyyyryyr', 'ryyyyryyy', 'ryyyyyryr', 'ryyyyyyrr',
-        'ryyyyyyyy', 'yryrrrrrr', 'yryrrrrry', 'yryrrryry',
-        'yryrryrrr', 'yryrryrry', 'yryrryryr', 'yryrryyrr',
-        'yryrryyry', 'yryrryyyy', 'yryyryrrr', 'yryyryrry',
-        'yryyryyry', 'yryyryyyy', 'yryyyyrrr', 'yryyyyrry',
-        'yryyyyryr', 'yryyyyyrr', 'yyrrrryyr', 'yyrrrryyy',
-        'yyrryryyr', 'yyrryryyy', 'yyyrrrrrr', 'yyyrrrrry',
-        'yyyrrrryr', 'yyyrrryrr', 'yyyrrryry', 'yyyrrryyr',
-        'yyyrrryyy', 'yyyrryrrr', 'yyyrryrry', 'yyyrryryr',
-        'yyyrryyrr', 'yyyrryyry', 'yyyrryyyr', 'yyyrryyyy',
-        'yyyryryrr', 'yyyryryry', 'yyyryryyr', 'yyyryryyy',
-        'yyyyyryyr', 'yyyyyryyy', 'yyyyyyryr', 'yyyyyyyrr'
-    ]
-    table = str.maketrans("ACGT", "ryry")
-    word_length = len(next(iter(patterns)))
-
-    for sequence in sequences:
-        ry_sequence = sequence.translate(table)
-        for i in range(len(sequence) - k + 1):
-            ry_pattern = ry_sequence[i:i + word_length]
-            if ry_pattern in patterns:
-                yield sequence[i:i + k]
-
-
-
-
-# def count_kmers_start_ry_4_push(sequences: List[str], k: int) -> Counter:
-#     """计算以特定 RY4_push 模式开头的 k-mer 频率"""
-#     patterns = [
-#         'rrrrryrrr', 'rrrrryrry', 'rrrrryryr', 'rrrrryryy',
-#         'rrrrryyrr', 'rrrrryyry', 'rrrrryyyy', 'rrrryyyrr',
-#         'rrrryyyry', 'rryrrrrry', 'rryrryrrr', 'rryrryrry',
-#         'rryrryryr', 'rryryrrrr', 'rryryrrry', 'rryryrryr',
-#         'rryryrryy', 'rryryryry', 'rryryyrrr', 'rryryyrry',
-#         'rryryyryr', 'rryryyryy', 'rryryyyrr', 'rryryyyry',
-#         'rryryyyyr', 'rryryyyyy', 'rryyyyrrr', 'rryyyyrry',
-#         'rryyyyryr', 'rryyyyryy', 'ryrrrrrrr', 'ryrrrrrry',
-#         'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrryrrr',
-#         'ryrrryrry', 'ryrrryryr', 'ryrrryryy', 'ryrrryyrr',
-#         'ryrrryyry', 'ryrrryyyy', 'ryrryyrrr', 'ryrryyrry',
-#         'ryrryyryr', 'ryrryyryy', 'ryrryyyrr', 'ryrryyyry',
-#         'ryrryyyyy', 'ryryryrrr', 'ryryryrry', 'ryryryyrr',
-#         'ryryryyry', 'ryryryyyy', 'ryyrrrrrr', 'ryyrrrrry',
-#         'ryyrrryry', 'ryyrryrrr', 'ryyrryrry', 'ryyrryryr',
-#         'ryyrryryy', 'ryyrryyrr', 'ryyrryyry', 'ryyrryyyy',
-#         'ryyryrrrr', 'ryyryrrry', 'ryyryrryy', 'ryyryryry',
-#         'ryyryyrrr', 'ryyryyrry', 'ryyryyryr', 'ryyryyryy',
-#         'ryyryyyrr', 'ryyryyyry', 'ryyryyyyy', 'ryyyyyrrr',
-#         'ryyyyyrry', 'ryyyyyryr', 'ryyyyyryy', 'ryyyyyyrr',
-#         'ryyyyyyry', 'yrrrryyyy', 'yrrryyyrr', 'yrrryyyry',
-#         'yryryyyrr', 'yryryyyry', 'yyrrrryrr', 'yyrrrryry',
-#         'yyrrrryyr', 'yyrrryrrr', 'yyrrryrry', 'yyrrryyrr',
-#         'yyrrryyry', 'yyrrryyyy', 'yyrryyyrr', 'yyrryyyry',
-#         'yyryrryrr', 'yyryrryry', 'yyryryrrr', 'yyryryrry',
-#         'yyryryyrr', 'yyryryyry', 'yyryryyyy', 'yyryyyyrr',
-#         'yyryyyyry', 'yyyrrrrrr', 'yyyrrrrry', 'yyyrrryry',
-#         'yyyrryrrr', 'yyyrryrry', 'yyyrryryr', 'yyyrryryy',
-#         'yyyrryyrr', 'yyyrryyry', 'yyyrryyyy', 'yyyryrrrr',
-#         'yyyryrrry', 'yyyryrryy', 'yyyryryry', 'yyyryyrrr',
-#         'yyyryyrry', 'yyyryyryr', 'yyyryyryy', 'yyyryyyrr',
-#         'yyyryyyry', 'yyyryyyyy', 'yyyyyyyrr', 'yyyyyyyry'
-#     ]
-#     purines = {'A', 'G'}
-#     pyrimidines = {'C', 'T'}
-#     kmers = []
-#     for sequence in sequences:
-#         for i in range(len(sequence) - k + 1):
-#             kmer = sequence[i:i + k]
-#             # Convert kmer to RY pattern
-#             ry_pattern = ''.join(['r' if base in purines else 'y' for base in kmer])
-#             # Check if the k-mer starts with any of the patterns
-#             if any(ry_pattern.startswith(pattern) for pattern in patterns):
-#                 kmers.append(kmer)
-#     return Counter(kmers)
-
+    return count_kmers_start_pattern(sequences, k, "4_9")
 
 def count_kmers_start_ry_4_push(sequences: List[str], k: int) -> Counter:
     """计算以特定 RY4_push 模式开头的 k-mer 频率"""
-    patterns = [
-        'rrrrryrrr', 'rrrrryrry', 'rrrrryryr', 'rrrrryryy',
-        'rrrrryyrr', 'rrrrryyry', 'rrrrryyyy', 'rrrryyyrr',
-        'rrrryyyry', 'rryrrrrry', 'rryrryrrr', 'rryrryrry',
-        'rryrryryr', 'rryryrrrr', 'rryryrrry', 'rryryrryr',
-        'rryryrryy', 'rryryryry', 'rryryyrrr', 'rryryyrry',
-        'rryryyryr', 'rryryyryy', 'rryryyyrr', 'rryryyyry',
-        'rryryyyyr', 'rryryyyyy', 'rryyyyrrr', 'rryyyyrry',
-        'rryyyyryr', 'rryyyyryy', 'ryrrrrrrr', 'ryrrrrrry',
-        'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrryrrr',
-        'ryrrryrry', 'ryrrryryr', 'ryrrryryy', 'ryrrryyrr',
-        'ryrrryyry', 'ryrrryyyy', 'ryrryyrrr', 'ryrryyrry',
-        'ryrryyryr', 'ryrryyryy', 'ryrryyyrr', 'ryrryyyry',
-        'ryrryyyyy', 'ryryryrrr', 'ryryryrry', 'ryryryyrr',
-        'ryryryyry', 'ryryryyyy', 'ryyrrrrrr', 'ryyrrrrry',
-        'ryyrrryry', 'ryyrryrrr', 'ryyrryrry', 'ryyrryryr',
-        'ryyrryryy', 'ryyrryyrr', 'ryyrryyry', 'ryyrryyyy',
-        'ryyryrrrr', 'ryyryrrry', 'ryyryrryy', 'ryyryryry',
-        'ryyryyrrr', 'ryyryyrry', 'ryyryyryr', 'ryyryyryy',
-        'ryyryyyrr', 'ryyryyyry', 'ryyryyyyy', 'ryyyyyrrr',
-        'ryyyyyrry', 'ryyyyyryr', 'ryyyyyryy', 'ryyyyyyrr',
-        'ryyyyyyry', 'yrrrryyyy', 'yrrryyyrr', 'yrrryyyry',
-        'yryryyyrr', 'yryryyyry', 'yyrrrryrr', 'yyrrrryry',
-        'yyrrrryyr', 'yyrrryrrr', 'yyrrryrry', 'yyrrryyrr',
-        'yyrrryyry', 'yyrrryyyy', 'yyrryyyrr', 'yyrryyyry',
-        'yyryrryrr', 'yyryrryry', 'yyryryrrr', 'yyryryrry',
-        'yyryryyrr', 'yyryryyry', 'yyryryyyy', 'yyryyyyrr',
-        'yyryyyyry', 'yyyrrrrrr', 'yyyrrrrry', 'yyyrrryry',
-        'yyyrryrrr', 'yyyrryrry', 'yyyrryryr', 'yyyrryryy',
-        'yyyrryyrr', 'yyyrryyry', 'yyyrryyyy', 'yyyryrrrr',
-        'yyyryrrry', 'yyyryrryy', 'yyyryryry', 'yyyryyrrr',
-        'yyyryyrry', 'yyyryyryr', 'yyyryyryy', 'yyyryyyrr',
-        'yyyryyyry', 'yyyryyyyy', 'yyyyyyyrr', 'yyyyyyyry'
-    ]
-    table = str.maketrans("ACGT", "ryry")
-    word_length = len(next(iter(patterns)))
-
-    for sequence in sequences:
-        ry_sequence = sequence.translate(table)
-        for i in range(len(sequence) - k + 1):
-            ry_pattern = ry_sequence[i:i + word_length]
-            if ry_pattern in patterns:
-                yield sequence[i:i + k]
-
-
-
-
-# def count_kmers_start_ry_4_pull(sequences: List[str], k: int) -> Counter:
-#     """计算以特定 RY4_pull 模式开头的 k-mer 频率"""
-#     patterns = [
-#         'rrrrrrrrr', 'rrrrrryrr', 'rrrrrryry', 'rrrrrryyr',
-#         'rrrrrryyy', 'rrryryrrr', 'rrryryyrr', 'rrryryyry',
-#         'rrryryyyr', 'rrryryyyy', 'rryrrrrrr', 'rryrrryrr',
-#         'rryrrryry', 'rryrrryyr', 'rryrryrrr', 'rryrryrry',
-#         'rryrryryr', 'rryrryyrr', 'rryrryyry', 'rryrryyyr',
-#         'rryrryyyy', 'rryryryyr', 'rryryryyy', 'rryyryrrr',
-#         'rryyryyrr', 'rryyryyry', 'rryyryyyr', 'rryyryyyy',
-#         'rryyyryrr', 'rryyyyrrr', 'rryyyyyrr', 'rryyyyyyr',
-#         'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrrryyy',
-#         'ryrrryyyr', 'ryrrryyyy', 'ryrryryyr', 'ryrryryyy',
-#         'ryryrryrr', 'ryryrryry', 'ryryrryyr', 'ryryrryyy',
-#         'ryryryrrr', 'ryryryrry', 'ryryryryr', 'ryyrrrrrr',
-#         'ryyrrrrry', 'ryyrrryrr', 'ryyrrryry', 'ryyrrryyr',
-#         'ryyrrryyy', 'ryyrryrrr', 'ryyrryrry', 'ryyrryryr',
-#         'ryyrryyrr', 'ryyrryyry', 'ryyrryyyr', 'ryyrryyyy',
-#         'ryyryryrr', 'ryyryryry', 'ryyryryyr', 'ryyryryyy',
-#         'ryyyrrrrr', 'ryyyrrrry', 'ryyyrryrr', 'ryyyrryry',
-#         'ryyyrryyr', 'ryyyrryyy', 'ryyyryryr', 'ryyyryyrr',
-#         'ryyyryyry', 'ryyyryyyr', 'ryyyryyyy', 'ryyyyryrr',
-#         'ryyyyryry', 'ryyyyryyr', 'ryyyyryyy', 'ryyyyyyyr',
-#         'yrrrrryrr', 'yrrrrryry', 'yrrrrryyr', 'yrrrrryyy',
-#         'yrryryrrr', 'yryrrrrrr', 'yryrrryrr', 'yryrrryry',
-#         'yryrrryyr', 'yryryryyr', 'yryryryyy', 'yryyryrrr',
-#         'yryyryyrr', 'yryyryyry', 'yryyryyyr', 'yryyryyyy',
-#         'yryyyryrr', 'yryyyyrrr', 'yryyyyyrr', 'yryyyyyyr',
-#         'yyrrrryrr', 'yyrrrryry', 'yyrrrryyr', 'yyrrrryyy',
-#         'yyrryryyr', 'yyrryryyy', 'yyryrryrr', 'yyryrryry',
-#         'yyryrryyr', 'yyryrryyy', 'yyryryrrr', 'yyyrrryrr',
-#         'yyyrrryry', 'yyyrrryyr', 'yyyrrryyy', 'yyyryryyr',
-#         'yyyryryyy', 'yyyyrrrrr', 'yyyyrryrr', 'yyyyrryry',
-#         'yyyyrryyr', 'yyyyrryyy', 'yyyyyryrr', 'yyyyyryry',
-#         'yyyyyryyr', 'yyyyyryyy', 'yyyyyyyyr', 'yyyyyyyyy'
-#     ]
-#     purines = {'A', 'G'}
-#     pyrimidines = {'C', 'T'}
-#     kmers = []
-#     for sequence in sequences:
-#         for i in range(len(sequence) - k + 1):
-#             kmer = sequence[i:i + k]
-#             # Convert kmer to RY pattern
-#             ry_pattern = ''.join(['r' if base in purines else 'y' for base in kmer])
-#             # Check if the k-mer starts with any of the patterns
-#             if any(ry_pattern.startswith(pattern) for pattern in patterns):
-#                 kmers.append(kmer)
-#     return Counter(kmers)
-
+    return count_kmers_start_pattern(sequences, k, "push")
 
 def count_kmers_start_ry_4_pull(sequences: List[str], k: int) -> Counter:
     """计算以特定 RY4_pull 模式开头的 k-mer 频率"""
-    patterns = [
-        'rrrrrrrrr', 'rrrrrryrr', 'rrrrrryry', 'rrrrrryyr',
-        'rrrrrryyy', 'rrryryrrr', 'rrryryyrr', 'rrryryyry',
-        'rrryryyyr', 'rrryryyyy', 'rryrrrrrr', 'rryrrryrr',
-        'rryrrryry', 'rryrrryyr', 'rryrryrrr', 'rryrryrry',
-        'rryrryryr', 'rryrryyrr', 'rryrryyry', 'rryrryyyr',
-        'rryrryyyy', 'rryryryyr', 'rryryryyy', 'rryyryrrr',
-        'rryyryyrr', 'rryyryyry', 'rryyryyyr', 'rryyryyyy',
-        'rryyyryrr', 'rryyyyrrr', 'rryyyyyrr', 'rryyyyyyr',
-        'ryrrrryrr', 'ryrrrryry', 'ryrrrryyr', 'ryrrrryyy',
-        'ryrrryyyr', 'ryrrryyyy', 'ryrryryyr', 'ryrryryyy',
-        'ryryrryrr', 'ryryrryry', 'ryryrryyr', 'ryryrryyy',
-        'ryryryrrr', 'ryryryrry', 'ryryryryr', 'ryyrrrrrr',
-        'ryyrrrrry', 'ryyrrryrr', 'ryyrrryry', 'ryyrrryyr',
-        'ryyrrryyy', 'ryyrryrrr', 'ryyrryrry', 'ryyrryryr',
-        'ryyrryyrr', 'ryyrryyry', 'ryyrryyyr', 'ryyrryyyy',
-        'ryyryryrr', 'ryyryryry', 'ryyryryyr', 'ryyryryyy',
-        'ryyyrrrrr', 'ryyyrrrry', 'ryyyrryrr', 'ryyyrryry',
-        'ryyyrryyr', 'ryyyrryyy', 'ryyyryryr', 'ryyyryyrr',
-        'ryyyryyry', 'ryyyryyyr', 'ryyyryyyy', 'ryyyyryrr',
-        'ryyyyryry', 'ryyyyryyr', 'ryyyyryyy', 'ryyyyyyyr',
-        'yrrrrryrr', 'yrrrrryry', 'yrrrrryyr', 'yrrrrryyy',
-        'yrryryrrr', 'yryrrrrrr', 'yryrrryrr', 'yryrrryry',
-        'yryrrryyr', 'yryryryyr', 'yryryryyy', 'yryyryrrr',
-        'yryyryyrr', 'yryyryyry', 'yryyryyyr', 'yryyryyyy',
-        'yryyyryrr', 'yryyyyrrr', 'yryyyyyrr', 'yryyyyyyr',
-        'yyrrrryrr', 'yyrrrryry', 'yyrrrryyr', 'yyrrrryyy',
-        'yyrryryyr', 'yyrryryyy', 'yyryrryrr', 'yyryrryry',
-        'yyryrryyr', 'yyryrryyy', 'yyryryrrr', 'yyyrrryrr',
-        'yyyrrryry', 'yyyrrryyr', 'yyyrrryyy', 'yyyryryyr',
-        'yyyryryyy', 'yyyyrrrrr', 'yyyyrryrr', 'yyyyrryry',
-        'yyyyrryyr', 'yyyyrryyy', 'yyyyyryrr', 'yyyyyryry',
-        'yyyyyryyr', 'yyyyyryyy', 'yyyyyyyyr', 'yyyyyyyyy'
-    ]
-    table = str.maketrans("ACGT", "ryry")
-    word_length = len(next(iter(patterns)))
-
-    for sequence in sequences:
-        ry_sequence = sequence.translate(table)
-        for i in range(len(sequence) - k + 1):
-            ry_pattern = ry_sequence[i:i + word_length]
-            if ry_pattern in patterns:
-                yield sequence[i:i + k]
+    return count_kmers_start_pattern(sequences, k, "pull")
 
 
 
 # 1. basic k-mer matches
-def basic_kmer_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
+def basic_kmer_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
     """calculate the number of k-mer matches between two sequences"""
+    if use_canonical_backend(backend, k, single_seq):
+        # seq1 on both strands, seq2 on its forward strand only
+        profile1 = canonical_kmer_profile(seq1, k, product_form=True)
+        profile2 = canonical_kmer_profile(seq2, k, product_form=True)
+        return product_matches(profile1, profile2)
     if single_seq == 1:
         seq1 = [seq1]
         seq2 = [seq2]
@@ -382,8 +119,14 @@ def basic_kmer_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
         seq1_reverse_comple = reverse_complement(seq1)
         seq1 = [seq1, seq1_reverse_comple]
         seq2 = [seq2] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = count_kmers(seq1, k)
-    kmer_count2 = count_kmers(seq2, k)
+    if use_numpy_backend(backend, k):
+        return product_matches(kmer_profile(seq1, k), kmer_profile(seq2, k))
+    if use_packed_backend(backend, k):
+        kmer_count1 = count_kmers_packed(seq1, k)
+        kmer_count2 = count_kmers_packed(seq2, k)
+    else:
+        kmer_count1 = count_kmers(seq1, k)
+        kmer_count2 = count_kmers(seq2, k)
     matches = 0
     for kmer in kmer_count1:
         if kmer in kmer_count2:
@@ -408,8 +151,10 @@ def basic_kmer_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
 #     return matches
 
 # 2. start_ry_matches
-def start_ry_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
+def start_ry_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
     """calculate the number of k-mer matches between two sequences"""
+    if use_canonical_backend(backend, k, single_seq):
+        return min_matches(canonical_kmer_profile(seq1, k, start_ry_filter), canonical_kmer_profile(seq2, k, start_ry_filter))
     if single_seq == 1:
         seq1 = [seq1]
         seq2 = [seq2]
@@ -418,8 +163,14 @@ def start_ry_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
         seq2_reverse_comple = reverse_complement(seq2)
         seq1 = [seq1, seq1_reverse_comple]
         seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = count_kmers_start_ry(seq1, k)
-    kmer_count2 = count_kmers_start_ry(seq2, k)
+    if use_numpy_backend(backend, k):
+        return min_matches(kmer_profile(seq1, k, start_ry_filter), kmer_profile(seq2, k, start_ry_filter))
+    if use_packed_backend(backend, k):
+        kmer_count1 = count_kmers_packed(seq1, k, start_ry_filter)
+        kmer_count2 = count_kmers_packed(seq2, k, start_ry_filter)
+    else:
+        kmer_count1 = count_kmers_start_ry(seq1, k)
+        kmer_count2 = count_kmers_start_ry(seq2, k)
     matches = 0
     for kmer in kmer_count1:
         if kmer in kmer_count2:
@@ -428,8 +179,10 @@ def start_ry_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
     return matches
 
 # 3. start_rr_matches
-def start_rr_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
+def start_rr_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
     """calculate the number of k-mer matches between two sequences"""
+    if use_canonical_backend(backend, k, single_seq):
+        return min_matches(canonical_kmer_profile(seq1, k, start_rr_filter), canonical_kmer_profile(seq2, k, start_rr_filter))
     if single_seq == 1:
         seq1 = [seq1]
         seq2 = [seq2]
@@ -438,17 +191,27 @@ def start_rr_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
         seq2_reverse_comple = reverse_complement(seq2)
         seq1 = [seq1, seq1_reverse_comple]
         seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = count_kmers_start_rr(seq1, k)
-    kmer_count2 = count_kmers_start_rr(seq2, k)
+    if use_numpy_backend(backend, k):
+        return min_matches(kmer_profile(seq1, k, start_rr_filter), kmer_profile(seq2, k, start_rr_filter))
+    if use_packed_backend(backend, k):
+        kmer_count1 = count_kmers_packed(seq1, k, start_rr_filter)
+        kmer_count2 = count_kmers_packed(seq2, k, start_rr_filter)
+    else:
+        kmer_count1 = count_kmers_start_rr(seq1, k)
+        kmer_count2 = count_kmers_start_rr(seq2, k)
     matches = 0
     for kmer in kmer_count1:
         if kmer in kmer_count2:
             matches += 0.5 * min(kmer_count1[kmer], kmer_count2[kmer])
     return matches 
 
-# 4. start_ry_4_6_matches
-def start_ry_4_6_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
+# 4. start_pattern_matches: k-mers starting with an RY pattern of a registered set
+def start_pattern_matches(seq1: str, seq2: str, k: int, pattern_set: str, single_seq: bool = True, backend: str = "string") -> int:
     """calculate the number of k-mer matches between two sequences"""
+    # below the word length the RY prefix reaches past the k-mer, so it is no k-mer property
+    if use_canonical_backend(backend, k, single_seq) and k >= pattern_word_length(pattern_set):
+        kmer_filter = get_pattern_filter(pattern_set)
+        return min_matches(canonical_kmer_profile(seq1, k, kmer_filter), canonical_kmer_profile(seq2, k, kmer_filter))
     if single_seq == 1:
         seq1 = [seq1]
         seq2 = [seq2]
@@ -457,74 +220,51 @@ def start_ry_4_6_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
         seq2_reverse_comple = reverse_complement(seq2)
         seq1 = [seq1, seq1_reverse_comple]
         seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = Counter(count_kmers_start_ry_4_6(seq1, k))
-    kmer_count2 = Counter(count_kmers_start_ry_4_6(seq2, k))
-    matches = 0
-    for kmer in kmer_count1:
-        if kmer in kmer_count2:
-            matches += 0.5 * min(kmer_count1[kmer], kmer_count2[kmer])
-    return matches
-
-def start_ry_4_9_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
-    """calculate the number of k-mer matches between two sequences"""
-    if single_seq == 1:
-        seq1 = [seq1]
-        seq2 = [seq2]
+    kmer_filter = get_pattern_filter(pattern_set)
+    if use_numpy_backend(backend, k):
+        return min_matches(kmer_profile(seq1, k, kmer_filter), kmer_profile(seq2, k, kmer_filter))
+    if use_packed_backend(backend, k):
+        kmer_count1 = count_kmers_packed(seq1, k, kmer_filter)
+        kmer_count2 = count_kmers_packed(seq2, k, kmer_filter)
     else:
-        seq1_reverse_comple = reverse_complement(seq1)
-        seq2_reverse_comple = reverse_complement(seq2)
-        seq1 = [seq1, seq1_reverse_comple]
-        seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = Counter(count_kmers_start_ry_4_9(seq1, k))
-    kmer_count2 = Counter(count_kmers_start_ry_4_9(seq2, k))
+        kmer_count1 = Counter(count_kmers_start_pattern(seq1, k, pattern_set))
+        kmer_count2 = Counter(count_kmers_start_pattern(seq2, k, pattern_set))
     matches = 0
     for kmer in kmer_count1:
         if kmer in kmer_count2:
             matches += 0.5 * min(kmer_count1[kmer], kmer_count2[kmer])
     return matches
 
-def start_ry_4_push_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
-    """calculate the number of k-mer matches between two sequences"""
-    if single_seq == 1:
-        seq1 = [seq1]
-        seq2 = [seq2]
-    else:
-        seq1_reverse_comple = reverse_complement(seq1)
-        seq2_reverse_comple = reverse_complement(seq2)
-        seq1 = [seq1, seq1_reverse_comple]
-        seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = Counter(count_kmers_start_ry_4_push(seq1, k))
-    kmer_count2 = Counter(count_kmers_start_ry_4_push(seq2, k))
-    matches = 0
-    for kmer in kmer_count1:
-        if kmer in kmer_count2:
-            matches += 0.5 * min(kmer_count1[kmer], kmer_count2[kmer])
-    return matches
+# pattern sets behind the historical start_ry_4_* method names
+PATTERN_SET_METHODS = {
+    "start_ry_4_6_matches": "4_6",
+    "start_ry_4_9_matches": "4_9",
+    "start_ry_4_push_matches": "push",
+    "start_ry_4_pull_matches": "pull",
+}
 
-def start_ry_4_pull_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
-    """calculate the number of k-mer matches between two sequences"""
-    if single_seq == 1:
-        seq1 = [seq1]
-        seq2 = [seq2]
-    else:
-        seq1_reverse_comple = reverse_complement(seq1)
-        seq2_reverse_comple = reverse_complement(seq2)
-        seq1 = [seq1, seq1_reverse_comple]
-        seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    kmer_count1 = Counter(count_kmers_start_ry_4_pull(seq1, k))
-    kmer_count2 = Counter(count_kmers_start_ry_4_pull(seq2, k))
-    matches = 0
-    for kmer in kmer_count1:
-        if kmer in kmer_count2:
-            matches += 0.5 * min(kmer_count1[kmer], kmer_count2[kmer])
-    return matches
+def start_ry_4_6_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
+    return start_pattern_matches(seq1, seq2, k, "4_6", single_seq, backend)
+
+def start_ry_4_9_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
+    return start_pattern_matches(seq1, seq2, k, "4_9", single_seq, backend)
+
+def start_ry_4_push_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
+    return start_pattern_matches(seq1, seq2, k, "push", single_seq, backend)
+
+def start_ry_4_pull_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string") -> int:
+    return start_pattern_matches(seq1, seq2, k, "pull", single_seq, backend)
 
 
-def spaced_word_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
-    """calculate the number of spaced-word matches between two sequences"""
-    # 根据 k 生成 pattern
-    pattern = generate_pattern(k)
-    
+def spaced_word_matches(seq1: str, seq2: str, k: int, single_seq: bool, backend: str = "string",
+                        n_seeds: int = 1, seed: int = 0) -> float:
+    """
+    calculate the number of spaced-word matches between two sequences,
+    averaged over n_seeds deterministic seed patterns of length k
+    """
+    # 根据 k 取固定的 pattern, 同一个 k 在所有序列对之间共用
+    patterns = spaced_seed_patterns(k, n_seeds, seed)
+
     if single_seq == 1:
         seq1 = [seq1]
         seq2 = [seq2]
@@ -533,22 +273,96 @@ def spaced_word_matches(seq1: str, seq2: str, k: int, single_seq: bool) -> int:
         seq2_reverse_comple = reverse_complement(seq2)
         seq1 = [seq1, seq1_reverse_comple]
         seq2 = [seq2, seq2_reverse_comple] # only one time reverse is okay, two reverse will make it slower
-    
-    # 提取 spaced words
-    spaced_words1 = []
-    spaced_words2 = []
-    
-    for sequence in seq1:
-        spaced_words1.extend(extract_spaced_word(sequence, pattern))
-    
-    for sequence in seq2:
-        spaced_words2.extend(extract_spaced_word(sequence, pattern))
-    
-    # 计算匹配数
-    word_count1 = Counter(spaced_words1)
-    word_count2 = Counter(spaced_words2)
+
+    weight = max(pattern.count('1') for pattern in patterns)
+    if use_numpy_backend(backend, weight):
+        profiles1 = spaced_word_profiles(seq1, patterns)
+        profiles2 = spaced_word_profiles(seq2, patterns)
+        return sum(min_matches(profile1, profile2) for profile1, profile2 in zip(profiles1, profiles2)) / len(patterns)
+
     matches = 0
-    for word in word_count1:
-        if word in word_count2:
-            matches += 0.5 * min(word_count1[word], word_count2[word])
-    return matches
\ No newline at end of file
+    for pattern in patterns:
+        if use_packed_backend(backend, weight):
+            word_count1 = count_spaced_words_packed(seq1, pattern)
+            word_count2 = count_spaced_words_packed(seq2, pattern)
+        else:
+            # 提取 spaced words
+            spaced_words1 = []
+            spaced_words2 = []
+
+            for sequence in seq1:
+                spaced_words1.extend(extract_valid_spaced_words(sequence, pattern))
+
+            for sequence in seq2:
+                spaced_words2.extend(extract_valid_spaced_words(sequence, pattern))
+
+            word_count1 = Counter(spaced_words1)
+            word_count2 = Counter(spaced_words2)
+
+        # 计算匹配数
+        for word in word_count1:
+            if word in word_count2:
+                matches += 0.5 * min(word_count1[word], word_count2[word])
+    return matches / len(patterns)
+
+
+def extract_valid_spaced_words(sequence: str, pattern: str) -> List[str]:
+    """spaced words of the windows that touch no non-ACGT character"""
+    words = extract_spaced_word(sequence, pattern)
+    if not sequence.translate(_DELETE_ACGT):
+        return words
+    valid = valid_window_mask(encode_sequence(sequence), len(pattern))
+    return [word for word, keep in zip(words, valid.tolist()) if keep]
+
+
+# k-mer filter, match form and whether seq2 is also counted on both strands,
+# for the methods that the index based engines can answer
+MATCH_METHOD_SPECS = {
+    "basic_kmer_matches": (None, "product", False),
+    "start_ry_matches": (start_ry_filter, "min", True),
+    "start_rr_matches": (start_rr_filter, "min", True),
+}
+
+def match_method_spec(method: str, pattern_set: str = None):
+    """(k-mer filter, match form, both strands of seq2) of a method, None if it has no spec"""
+    if method in PATTERN_SET_METHODS:
+        pattern_set = PATTERN_SET_METHODS[method]
+        method = "start_pattern_matches"
+    if method == "start_pattern_matches":
+        return get_pattern_filter(pattern_set), "min", True
+    return MATCH_METHOD_SPECS.get(method)
+
+def match_strands(seq1: str, seq2: str, single_seq: bool, both_strands_seq2: bool):
+    """the sequence lists that the *_matches functions count for seq1 and seq2"""
+    if single_seq == 1:
+        return [seq1], [seq2]
+    if both_strands_seq2:
+        return [seq1, reverse_complement(seq1)], [seq2, reverse_complement(seq2)]
+    return [seq1, reverse_complement(seq1)], [seq2]
+
+def match_profile(sequence: str, k: int, method: str, role: int, single_seq: bool,
+                  backend: str = "numpy", pattern_set: str = None, telemetry: Telemetry = None) -> KmerProfile:
+    """
+    k-mer profile of one sequence as `method` counts it for seq1 (role 1) or seq2
+    (role 2) of a pair, so that it can be reused for every pair the sequence is in.
+    Two profiles give the matches of the method through profile_matches.
+    """
+    kmer_filter, form, both_strands_seq2 = match_method_spec(method, pattern_set)
+    both_strands = role == 1 or both_strands_seq2
+    word_length = 0
+    if method in PATTERN_SET_METHODS or method == "start_pattern_matches":
+        word_length = pattern_word_length(PATTERN_SET_METHODS.get(method, pattern_set))
+    if use_canonical_backend(backend, k, single_seq) and k >= word_length:
+        return canonical_kmer_profile(sequence, k, kmer_filter, form == "product")
+    if single_seq == 1 or not both_strands:
+        return kmer_profile([sequence], k, kmer_filter)
+    with measure(telemetry, "reverse_complement", k) as counts:
+        counts["bytes"] = len(sequence)
+        sequence_reverse_comple = reverse_complement(sequence)
+    return kmer_profile([sequence, sequence_reverse_comple], k, kmer_filter)
+
+def profile_matches(profile1: KmerProfile, profile2: KmerProfile, method: str, pattern_set: str = None):
+    """matches of a method between the profiles of seq1 and seq2 from match_profile"""
+    if match_method_spec(method, pattern_set)[1] == "product":
+        return product_matches(profile1, profile2)
+    return min_matches(profile1, profile2)
@@ -0,0 +1,147 @@
+from typing import List, Optional
+
+import numpy as np
+
+from model.kmer_engine import INVALID_BASE, KmerFilter, encode_sequence, invalid_runs
+
+# Generalized suffix array over seq1 + seq2 for counting k-mer matches of every k
+# from a single index. Suffixes are sorted up to the largest k that will be asked
+# for: the first symbols of every suffix are bit-packed into one int64 key, and
+# prefix doubling on the ranks of those keys takes over for longer prefixes. The
+# LCP of neighbouring suffixes (capped at the sort depth) is recovered from the
+# same keys and ranks. For a given k, runs of suffixes with LCP >= k are exactly
+# the occurrences of one k-mer, so N_k is a segmented reduction over the LCP
+# array instead of a fresh k-mer count.
+
+
+def _dense_rank(keys: np.ndarray) -> np.ndarray:
+    _, rank = np.unique(keys, return_inverse=True)
+    return rank.astype(np.int64).reshape(-1)
+
+
+def _window_room(sequence: str) -> np.ndarray:
+    """longest window starting at every position that touches no non-ACGT character"""
+    positions = np.arange(len(sequence), dtype=np.int64)
+    encoded = encode_sequence(sequence)
+    starts, _ = invalid_runs(encoded)
+    if len(starts) == 0:
+        return len(sequence) - positions
+    # within a run of invalid characters the room is 0, up to the run the distance to its start
+    ends = np.append(starts, len(sequence))
+    room = ends[np.searchsorted(ends, positions)] - positions
+    room[encoded == INVALID_BASE] = 0
+    return room
+
+
+class SuffixArrayMatchIndex:
+    def __init__(self, sequences1: List[str], sequences2: List[str], max_k: int):
+        """
+        Build the index once for two groups of sequences (e.g. both strands of seq1
+        and of seq2). The sequences are concatenated; windows running across the
+        end of a sequence or touching a non-ACGT character (an N run, a contig
+        boundary) are given no weight, so they never produce a match.
+        """
+        self.max_k = max_k
+        self.sequences = list(sequences1) + list(sequences2)
+        self.starts = []
+        raw = []
+        owner = []
+        remaining = []
+        position = 0
+        for index, sequence in enumerate(self.sequences):
+            raw.append(np.frombuffer(sequence.encode("latin-1"), dtype=np.uint8))
+            owner.append(np.full(len(sequence), 1 if index < len(sequences1) else 2, dtype=np.int8))
+            remaining.append(_window_room(sequence))
+            self.starts.append(position)
+            position += len(sequence)
+        text = np.concatenate(raw) if raw else np.zeros(0, dtype=np.uint8)
+        self.owner = np.concatenate(owner) if owner else np.zeros(0, dtype=np.int8)
+        self.remaining = np.concatenate(remaining) if remaining else np.zeros(0, dtype=np.int64)
+        self.n = len(text)
+
+        # pack the first `packed_length` symbols of every suffix into one key,
+        # symbols are numbered from 1 so that 0 pads suffixes near the end
+        alphabet, symbols = np.unique(text, return_inverse=True)
+        self.bits = max(int(len(alphabet)).bit_length(), 1)
+        self.packed_length = 63 // self.bits
+        self.keys = np.zeros(self.n, dtype=np.int64)
+        padded = np.zeros(self.n + self.packed_length, dtype=np.int64)
+        padded[:self.n] = symbols.reshape(-1) + 1
+        for offset in range(self.packed_length):
+            self.keys <<= self.bits
+            self.keys |= padded[offset:offset + self.n]
+
+        # prefix doubling: ranks[h] orders the suffixes by their first h symbols
+        h = self.packed_length
+        self.ranks = {h: _dense_rank(self.keys)}
+        while h < max_k:
+            rank = self.ranks[h]
+            shifted = np.full(self.n, -1, dtype=np.int64)
+            # once h reaches n every shifted rank is past the end
+            shifted[:max(self.n - h, 0)] = rank[min(h, self.n):]
+            self.ranks[2 * h] = _dense_rank(rank * (self.n + 1) + shifted + 1)
+            h *= 2
+        self.sa = np.argsort(self.ranks[h], kind="stable")
+        self.lcp = self._capped_lcp()
+        self.owner_sa = self.owner[self.sa]
+        self.remaining_sa = self.remaining[self.sa]
+        self.encoded = [encode_sequence(sequence) for sequence in self.sequences]
+
+    def _prefix_levels(self):
+        """(length, array) pairs whose entries are equal iff two suffixes share that many first symbols"""
+        for h in sorted(self.ranks, reverse=True):
+            yield h, self.ranks[h]
+        h = 1 << ((self.packed_length - 1).bit_length() - 1) if self.packed_length > 1 else 0
+        while h >= 1:
+            yield h, self.keys >> (self.bits * (self.packed_length - h))
+            h //= 2
+
+    def _capped_lcp(self) -> np.ndarray:
+        """LCP of each suffix with its predecessor in the suffix array, capped at the sort depth"""
+        if self.n < 2:
+            return np.zeros(0, dtype=np.int64)
+        left = self.sa[:-1]
+        right = self.sa[1:]
+        lcp = np.zeros(self.n - 1, dtype=np.int64)
+        for h, prefix in self._prefix_levels():
+            a = left + lcp
+            b = right + lcp
+            inside = (a < self.n) & (b < self.n)
+            same = inside & (prefix[np.minimum(a, self.n - 1)] == prefix[np.minimum(b, self.n - 1)])
+            lcp += same * h
+        return lcp
+
+    def _weights(self, k: int, kmer_filter: Optional[KmerFilter]) -> np.ndarray:
+        """per suffix array entry: 1 or 2 when a kept k-mer of that group starts there, else 0"""
+        keep = self.remaining_sa >= k
+        if kmer_filter is not None:
+            selected = np.zeros(self.n, dtype=bool)
+            for start, encoded in zip(self.starts, self.encoded):
+                mask = kmer_filter(encoded, k)
+                selected[start:start + len(mask)] = mask
+            keep &= selected[self.sa]
+        return np.where(keep, self.owner_sa, 0)
+
+    def group_counts(self, k: int, kmer_filter: Optional[KmerFilter] = None):
+        """occurrence counts in both groups of every distinct k-mer"""
+        if k > self.max_k:
+            raise ValueError(f"Index was built for k <= {self.max_k}, got k = {k}")
+        if self.n == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        owner = self._weights(k, kmer_filter)
+        starts = np.flatnonzero(np.concatenate(([True], self.lcp < k)))
+        # both counts in one reduction: group 1 in the low 32 bits, group 2 in the high ones
+        packed = (owner == 1).astype(np.int64) | ((owner == 2).astype(np.int64) << 32)
+        counts = np.add.reduceat(packed, starts)
+        return counts & 0xFFFFFFFF, counts >> 32
+
+    def product_matches(self, k: int, kmer_filter: Optional[KmerFilter] = None) -> int:
+        """sum of count1 * count2 over shared k-mers"""
+        counts1, counts2 = self.group_counts(k, kmer_filter)
+        return int(np.dot(counts1, counts2))
+
+    def min_matches(self, k: int, kmer_filter: Optional[KmerFilter] = None) -> float:
+        """0.5 * sum of min(count1, count2) over shared k-mers"""
+        counts1, counts2 = self.group_counts(k, kmer_filter)
+        return 0.5 * int(np.minimum(counts1, counts2).sum())
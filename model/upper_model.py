@@ -1,16 +1,23 @@
 from model.F_k_function import F_k_funtion
 from model.evolution_models import estimate_jukes_cantor_distance
+from utils.telemetry import measure
 
-def compute_distance(seq1, seq2, args):
+def compute_distance(seq1, seq2, args, profile_cache=None, seq_ids=None, telemetry=None):
     """
     Compute the distance between two sequences using the upper model.
+    With a profile_cache and seq_ids = (id1, id2) the k-mer profiles of the
+    two sequences are taken from / stored in the cache. With a Telemetry the
+    time spent in every stage is added to it.
     """
-    # 1. calculate p_hat
-    F_k_function_obj = F_k_funtion(seq1, seq2, args)
-    p_hat = F_k_function_obj.calculate_p_hat()
+    with measure(telemetry, "pair") as counts:
+        counts["bytes"] = len(seq1) + len(seq2)
+        # 1. calculate p_hat
+        F_k_function_obj = F_k_funtion(seq1, seq2, args, profile_cache, seq_ids, telemetry)
+        p_hat = F_k_function_obj.calculate_p_hat()
 
-    # 2. calculate distance
-    distance = estimate_jukes_cantor_distance(p_hat)
+        # 2. calculate distance
+        with measure(telemetry, "distance"):
+            distance = estimate_jukes_cantor_distance(p_hat)
 
     return distance
     
\ No newline at end of file
@@ -9,8 +9,9 @@ import yaml
 from easydict import EasyDict
 from utils.file_system import *
 from utils.logger import setup_logger
+from utils.telemetry import make_telemetry, measure, write_telemetry_report
 
-from model.upper_model import compute_distance
+from model.distance_matrix import build_distance_matrix
 
 # Initialize logger
 logger = setup_logger()
@@ -32,41 +33,23 @@ def main():
         bool_use_empirical_formula = args.get("bool_use_empirical_formula", True)
 
         logger.info(f"Loading sequences from {data_path}")
-        names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path)
+        telemetry = make_telemetry(args)
+        with measure(telemetry, "load") as counts:
+            names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path, genome_level=args.get("genome_level", False))
+            counts["bytes"] = sum(len(sequence) for sequence in seqs)
         logger.info(f"Loaded {len(seqs)} sequences")
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        save_path_tsv = args.get("output_path", "../result")+f"/af_project_evaluation_{timestamp}_{k_mers_method}_{background_matches_method}_{bool_use_single_seq}_{bool_use_empirical_formula}.tsv"
         save_path_phy = args.get("output_path", "../result")+f"/af_project_evaluation_{timestamp}_{k_mers_method}_{background_matches_method}_{bool_use_single_seq}_{bool_use_empirical_formula}.phy"
 
-        # # TSV file format:
-        # # name1 name2 distance
-        # logger.info(f"Saving results to {save_path_tsv}")
-        # with open(save_path_tsv, "w") as f:
-        #     for i in range(len(seqs)):
-        #         for j in range(len(seqs)):
-        #             dist = compute_distance(seqs[i], seqs[j], args)
-        #             f.write(f"{names[i]}\t{names[j]}\t{dist:.6f}\n")
-        
-
         # PHYLIP file format:
         logger.info(f"Saving results to {save_path_phy}")
-        N = len(seqs)
-        distance_matrix = [[0.0 for _ in range(N)] for _ in range(N)]
-        for i in range(N):
-            for j in range(N):
-                if i == j:
-                    distance_matrix[i][j] = 0.0
-                else:
-                    distance_matrix[i][j] = compute_distance(seqs[i], seqs[j], args)
+        distance_matrix = build_distance_matrix(seqs, args, names=names, telemetry=telemetry)
 
         # 写入 PHYLIP 格式
-        with open(save_path_phy, "w") as f:
-            f.write(f"{N}\n")
-            for i in range(N):
-                name = names[i][:10].ljust(10)  # PHYLIP 格式要求名字最多10字符
-                row = " ".join(f"{distance_matrix[i][j]:.6f}" for j in range(N))
-                f.write(f"{name}{row}\n")
+        write_phylip(save_path_phy, names, distance_matrix)
+        if telemetry is not None:
+            logger.info(f"Telemetry saved to {write_telemetry_report(telemetry, save_path_phy)[0]}")
         logger.info("PHYLIP evaluation completed successfully")
 
         logger.info("Evaluation completed successfully")
@@ -0,0 +1,61 @@
+import sys
+import os
+import argparse
+import asyncio
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import yaml
+from easydict import EasyDict
+from utils.logger import setup_logger
+
+from model.distance_service import DistanceService
+
+# Initialize logger
+logger = setup_logger()
+
+# Start the long-running distance service, which keeps loaded genomes and their
+# k-mer profiles between requests (protocol in model/distance_service.py).
+#
+#   python distance_server.py --config <yaml> --socket /tmp/slopesearch.sock [--workers 8] [--load <fasta dir>] [--genome-level]
+#   python distance_server.py --config <yaml> --port 8765
+#
+# Clients connect with model.distance_service.DistanceClient, e.g.
+#   client = DistanceClient(socket_path="/tmp/slopesearch.sock")
+#   client.load("../dataset/test.fasta"); client.distance("seq1", "seq2")
+
+def main():
+    parser = argparse.ArgumentParser(description="Distance service with warm caches")
+    parser.add_argument("--config", required=True, help="default method config (YAML)")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", help="Unix socket path")
+    address.add_argument("--port", type=int, help="localhost TCP port")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default n_workers or all cores)")
+    parser.add_argument("--load", action="append", default=[], help="FASTA file or directory to load at start-up")
+    parser.add_argument("--genome-level", action="store_true", help="load every FASTA file as one multi-contig genome (default genome_level of the config)")
+    cli_args = parser.parse_args()
+
+    try:
+        logger.info(f"Loading configuration from {cli_args.config}")
+        with open(cli_args.config) as f:
+            config = yaml.load(f, Loader=yaml.FullLoader)
+        args = EasyDict(config)
+        if cli_args.genome_level:
+            args.genome_level = True
+
+        async def run():
+            service = DistanceService(args, cli_args.workers)
+            for path in cli_args.load:
+                await service.load(path)
+            await service.serve(cli_args.socket, cli_args.port)
+
+        asyncio.run(run())
+        logger.info("Distance service stopped")
+
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import sys
+import os
+import argparse
+from datetime import datetime
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import yaml
+from easydict import EasyDict
+from utils.file_system import *
+from utils.logger import setup_logger
+from utils.telemetry import make_telemetry, measure, write_telemetry_report
+
+from model.distance_matrix import build_matrix_shard, merge_matrix_shards
+
+# Initialize logger
+logger = setup_logger()
+
+# Split the pairs of one evaluation config into M shards that can run as
+# independent processes on any node, then merge their partial files.
+#
+#   python matrix_shards.py run   --config <yaml> --shard 0/4
+#   ...
+#   python matrix_shards.py run   --config <yaml> --shard 3/4
+#   python matrix_shards.py merge --config <yaml> --shards 4 [--format tsv]
+#
+# Locally: for i in 0 1 2 3; do python matrix_shards.py run --config <yaml> --shard $i/4 & done; wait
+# All shard processes and the merge need the same config and dataset; the
+# partial files go to shard_dir (default <output_path>/shards). With telemetry: true
+# in the config every shard also writes its stage timings next to its partial file.
+
+def parse_shard(value: str):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard expects i/M, got {value}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {count}), got {value}")
+    return index, count
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded distance matrix computation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="compute the pairs of one shard")
+    run_parser.add_argument("--config", required=True, help="evaluation config (YAML)")
+    run_parser.add_argument("--shard", required=True, type=parse_shard, help="shard i/M, 0 <= i < M")
+    run_parser.add_argument("--parallel", action="store_true", help="use a process pool within the shard")
+    merge_parser = subparsers.add_parser("merge", help="assemble the matrix from all shards")
+    merge_parser.add_argument("--config", required=True, help="evaluation config (YAML)")
+    merge_parser.add_argument("--shards", required=True, type=int, help="number of shards M")
+    merge_parser.add_argument("--format", choices=["phylip", "tsv"], default="phylip")
+    cli_args = parser.parse_args()
+
+    try:
+        logger.info(f"Loading configuration from {cli_args.config}")
+        with open(cli_args.config) as f:
+            config = yaml.load(f, Loader=yaml.FullLoader)
+        args = EasyDict(config)
+
+        data_path = args.get("data_path", "../dataset/test.fasta")
+        logger.info(f"Loading sequences from {data_path}")
+        telemetry = make_telemetry(args)
+        with measure(telemetry, "load") as counts:
+            names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path, genome_level=args.get("genome_level", False))
+            counts["bytes"] = sum(len(sequence) for sequence in seqs)
+        logger.info(f"Loaded {len(seqs)} sequences")
+
+        if cli_args.command == "run":
+            shard_index, shard_count = cli_args.shard
+            path = build_matrix_shard(seqs, args, shard_index, shard_count, cli_args.parallel, telemetry)
+            logger.info(f"Shard {shard_index}/{shard_count} written to {path}")
+            if telemetry is not None:
+                logger.info(f"Telemetry saved to {write_telemetry_report(telemetry, path)[0]}")
+            return
+
+        distance_matrix = merge_matrix_shards(seqs, args, cli_args.shards)
+        k_mers_method = args.get("k_mers_method", "basic_kmer_matches")
+        background_matches_method = args.get("background_matches_method", "static_method")
+        bool_use_single_seq = args.get("bool_use_single_seq", True)
+        bool_use_empirical_formula = args.get("bool_use_empirical_formula", True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        save_path = args.get("output_path", "../result")+f"/af_project_evaluation_{timestamp}_{k_mers_method}_{background_matches_method}_{bool_use_single_seq}_{bool_use_empirical_formula}"
+        if cli_args.format == "phylip":
+            write_phylip(save_path + ".phy", names, distance_matrix)
+            logger.info(f"Merged matrix saved to {save_path}.phy")
+        else:
+            write_distance_tsv(save_path + ".tsv", names, distance_matrix)
+            logger.info(f"Merged matrix saved to {save_path}.tsv")
+
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    main()
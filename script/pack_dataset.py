@@ -0,0 +1,39 @@
+import sys
+import os
+import argparse
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+from utils.file_system import find_fasta_files
+from utils.logger import setup_logger
+from utils.packed_sequences import pack_fasta_files
+
+# Initialize logger
+logger = setup_logger()
+
+# Convert a FASTA dataset (a file or a directory, possibly compressed) into a
+# packed 2-bit container. The container can then be used as data_path in any
+# config, the loaders memory-map it instead of parsing the FASTA files again.
+#
+#   python pack_dataset.py --data <fasta file or directory> --output <dataset.ss2bit> [--genome-level]
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a FASTA dataset into a 2-bit container")
+    parser.add_argument("--data", required=True, help="FASTA file or directory")
+    parser.add_argument("--output", required=True, help="container file to write")
+    parser.add_argument("--genome-level", action="store_true", help="one sequence per FASTA file, contigs kept apart")
+    cli_args = parser.parse_args()
+
+    try:
+        fasta_files = find_fasta_files(cli_args.data) if os.path.isdir(cli_args.data) else [cli_args.data]
+        logger.info(f"Packing {len(fasta_files)} FASTA files into {cli_args.output}")
+        n_sequences = pack_fasta_files(fasta_files, cli_args.output, cli_args.genome_level)
+        logger.info(f"Packed {n_sequences} sequences ({os.path.getsize(cli_args.output) / 2**20:.1f} MB)")
+
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import argparse
+from datetime import datetime
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import yaml
+from easydict import EasyDict
+from utils.file_system import *
+from utils.logger import setup_logger
+from utils.telemetry import make_telemetry, measure, write_telemetry_report
+
+from model.distance_matrix import build_distance_matrices, build_distance_matrices_streaming
+
+# Initialize logger
+logger = setup_logger()
+
+# Run several evaluation methods on one dataset in a single sweep instead of one
+# start_af_project_evaluation_*.py script per method: the dataset is loaded once,
+# one process pool is kept for all methods, and the k-mer profiles the methods
+# have in common are counted once.
+#
+#   python run_evaluation.py --config ../config/assembled-fish_mito/af_project_evaluation_all.yaml [--parallel] [--stream]
+#
+# With --stream the distances of every genome file are scheduled as soon as the
+# file is parsed, while the remaining files are still loading (no checkpoints).
+#
+# The config holds the shared keys (data_path, output_path, cache and pool
+# settings, ...) at the top level and one entry per method under "methods";
+# a method's own keys override the shared ones.
+#
+# With telemetry: true at the top level, the stage timings of all methods are
+# written to af_project_evaluation_<timestamp>_telemetry.json/.csv in output_path.
+
+def method_configs(config: dict):
+    """(method name, full config) of every method of a runner config"""
+    shared = {key: value for key, value in config.items() if key != "methods"}
+    methods = config.get("methods", None)
+    if not methods:
+        raise ValueError("The config lists no methods")
+    return [(name, EasyDict({**shared, **(method or {})})) for name, method in methods.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Distance matrices of several methods in one sweep")
+    parser.add_argument("--config", required=True, help="runner config (YAML) with a methods section")
+    parser.add_argument("--parallel", action="store_true", help="compute the pairs in a process pool")
+    parser.add_argument("--stream", action="store_true", help="start computing while the files are loading")
+    cli_args = parser.parse_args()
+
+    try:
+        logger.info(f"Loading configuration from {cli_args.config}")
+        with open(cli_args.config) as f:
+            config = yaml.load(f, Loader=yaml.FullLoader)
+        methods = method_configs(config)
+
+        data_path = config.get("data_path", "../dataset/test.fasta")
+        logger.info(f"Computing {len(methods)} matrices: {', '.join(name for name, _ in methods)}")
+        telemetry = make_telemetry(config)
+        if cli_args.stream:
+            logger.info(f"Streaming sequences from {data_path}")
+            names, distance_matrices = build_distance_matrices_streaming(
+                iter_sequence_batches_from_multiple_files(data_path, genome_level=config.get("genome_level", False)), [args for _, args in methods], cli_args.parallel, telemetry)
+        else:
+            logger.info(f"Loading sequences from {data_path}")
+            with measure(telemetry, "load") as counts:
+                names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path, genome_level=config.get("genome_level", False))
+                counts["bytes"] = sum(len(sequence) for sequence in seqs)
+            logger.info(f"Loaded {len(seqs)} sequences")
+            distance_matrices = build_distance_matrices(seqs, [args for _, args in methods], cli_args.parallel, names, telemetry)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for (name, args), distance_matrix in zip(methods, distance_matrices):
+            k_mers_method = args.get("k_mers_method", "basic_kmer_matches")
+            background_matches_method = args.get("background_matches_method", "static_method")
+            bool_use_single_seq = args.get("bool_use_single_seq", True)
+            bool_use_empirical_formula = args.get("bool_use_empirical_formula", True)
+            # the method's key keeps the files of methods apart that differ only in e.g. pattern_set or kmer_backend
+            method_tag = f"{name}_{args.pattern_set}" if args.get("pattern_set", None) else name
+            save_path_phy = args.get("output_path", "../result")+f"/af_project_evaluation_{timestamp}_{method_tag}_{k_mers_method}_{background_matches_method}_{bool_use_single_seq}_{bool_use_empirical_formula}.phy"
+            write_phylip(save_path_phy, names, distance_matrix)
+            logger.info(f"{name}: saved to {save_path_phy}")
+        if telemetry is not None:
+            report_path = config.get("output_path", "../result")+f"/af_project_evaluation_{timestamp}.phy"
+            logger.info(f"Telemetry saved to {write_telemetry_report(telemetry, report_path)[0]}")
+
+        logger.info("Evaluation completed successfully")
+
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ from utils.file_system import load_sequences_for_evaluation_from_multiple_files
 from utils.logger import setup_logger
 import pandas as pd
 
-from model.upper_model import compute_distance
+from model.distance_matrix import build_distance_matrix
 
 # Initialize logger
 logger = setup_logger()
@@ -25,15 +25,9 @@ def measure_matrix_build_time(seqs, names, method_config, method_name):
     
     try:
         N = len(seqs)
-        distance_matrix = [[0.0 for _ in range(N)] for _ in range(N)]
         
         # 构建距离矩阵
-        for i in range(N):
-            for j in range(N):
-                if i == j:
-                    distance_matrix[i][j] = 0.0
-                else:
-                    distance_matrix[i][j] = compute_distance(seqs[i], seqs[j], method_config)
+        distance_matrix = build_distance_matrix(seqs, method_config)
         
         end_time = time.time()
         execution_time = end_time - start_time
@@ -77,7 +71,7 @@ def main():
         
         # 加载序列数据
         logger.info(f"Loading sequences from {data_path}")
-        names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path)
+        names, seqs = load_sequences_for_evaluation_from_multiple_files(data_path, genome_level=args.get("genome_level", False))
         logger.info(f"Loaded {len(seqs)} sequences")
         
         # 检查序列数量
@@ -104,7 +98,9 @@ def main():
                 "k_mers_method": method_config.get("k_mers_method"),
                 "bool_use_single_seq": method_config.get("bool_use_single_seq", True),
                 "bool_use_empirical_formula": method_config.get("bool_use_empirical_formula", True),
-                "background_matches_method": method_config.get("background_matches_method", "no_background_matches")
+                "background_matches_method": method_config.get("background_matches_method", "no_background_matches"),
+                "kmer_backend": method_config.get("kmer_backend", args.get("kmer_backend", "string")),
+                "profile_cache_mb": method_config.get("profile_cache_mb", args.get("profile_cache_mb", 512)),
             }
             
             execution_time, distance_matrix = measure_matrix_build_time(seqs, names, method_params, method_name)
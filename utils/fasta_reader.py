@@ -0,0 +1,128 @@
+import bz2
+import gzip
+import lzma
+import os
+from typing import BinaryIO, Iterator, List, Tuple
+
+from utils.sequence_tool import CONTIG_BOUNDARY
+
+# Biopython-free FASTA reader. The file is read in large binary blocks and cut
+# at "\n>" record boundaries with bytes.find, so no per-line Python work is done;
+# newlines and blanks are dropped and the case is folded by a single
+# bytes.translate per record.
+#
+# In genome-level mode all records of a file form one sequence, the contigs
+# joined by CONTIG_BOUNDARY so that no k-mer is counted across two of them.
+#
+# gzip, bzip2 and xz files are recognised by their magic bytes and decompressed
+# as a stream, block by block, so they never have to be unpacked to disk.
+BLOCK_SIZE = 1 << 22
+FASTA_SUFFIXES = (".fasta", ".fa", ".fna")
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz")
+
+_MAGIC_OPENERS = ((b"\x1f\x8b", gzip.open), (b"BZh", bz2.open), (b"\xfd7zXZ\x00", lzma.open))
+
+_WHITESPACE = b" \t\r\n"
+_UPPER_TABLE = bytes(range(256)).upper()
+
+
+def is_fasta_file(file_path: str) -> bool:
+    """whether the file name is a FASTA file, possibly compressed"""
+    name = file_path.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name.endswith(FASTA_SUFFIXES)
+
+
+def open_fasta(file_path: str) -> BinaryIO:
+    """binary stream of a FASTA file, decompressing gzip, bzip2 and xz files on the fly"""
+    with open(file_path, "rb") as f:
+        magic = f.read(6)
+    for prefix, opener in _MAGIC_OPENERS:
+        if magic.startswith(prefix):
+            return opener(file_path, "rb")
+    return open(file_path, "rb")
+
+
+def iter_fasta_records(file_path: str, table: bytes = None, block_size: int = BLOCK_SIZE) -> Iterator[Tuple[str, bytes]]:
+    """
+    (id, sequence) of every record, the id being the first word of the header
+    as in Bio.SeqIO; the sequence bytes are passed through table (None keeps
+    them as they are) with whitespace removed. Text before the first header is
+    ignored.
+    """
+    header = None
+    header_parts = []
+    header_done = True
+    parts = []
+    at_line_start = True
+    with open_fasta(file_path) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            pos = 0
+            while pos < len(block):
+                if not header_done:
+                    end = block.find(b"\n", pos)
+                    if end == -1:
+                        header_parts.append(block[pos:])
+                        pos = len(block)
+                        break
+                    header_parts.append(block[pos:end])
+                    header, header_done, at_line_start = b"".join(header_parts), True, True
+                    pos = end + 1
+                    continue
+                if at_line_start and block[pos] == 62:  # ">"
+                    if header is not None:
+                        yield _record_id(header), b"".join(parts).translate(table, _WHITESPACE)
+                    header_parts, header_done, parts = [], False, []
+                    pos += 1
+                    continue
+                end = block.find(b"\n>", pos)
+                if end == -1:
+                    parts.append(block[pos:])
+                    at_line_start = block.endswith(b"\n")
+                    break
+                parts.append(block[pos:end + 1])
+                pos, at_line_start = end + 1, True
+    if not header_done:
+        header = b"".join(header_parts)
+    if header is not None:
+        yield _record_id(header), b"".join(parts).translate(table, _WHITESPACE)
+
+
+def _record_id(header: bytes) -> str:
+    words = header.split(None, 1)
+    return words[0].decode("latin-1") if words else ""
+
+
+def read_fasta(file_path: str, uppercase: bool = True) -> Tuple[List[str], List[str]]:
+    """names and sequences (as str) of a FASTA file"""
+    names, seqs = [], []
+    for name, sequence in iter_fasta_records(file_path, _UPPER_TABLE if uppercase else None):
+        names.append(name)
+        seqs.append(sequence.decode("latin-1"))
+    return names, seqs
+
+
+def genome_name(file_path: str) -> str:
+    """name of the genome in a FASTA file: the file name without FASTA and compression suffixes"""
+    name = os.path.basename(file_path)
+    for suffixes in (COMPRESSED_SUFFIXES, FASTA_SUFFIXES):
+        for suffix in suffixes:
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+    return name
+
+
+def read_fasta_genome(file_path: str, uppercase: bool = True) -> Tuple[List[str], List[str]]:
+    """
+    the records of a FASTA file as one genome-level sequence, [name] and [sequence],
+    with the contigs separated by CONTIG_BOUNDARY
+    """
+    contigs = [sequence for _, sequence in iter_fasta_records(file_path, _UPPER_TABLE if uppercase else None)]
+    return [genome_name(file_path)], [CONTIG_BOUNDARY.encode().join(contigs).decode("latin-1")]
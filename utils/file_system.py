@@ -1,8 +1,11 @@
-from Bio import SeqIO
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
+import concurrent.futures
 import os
 import glob
 
+from utils.fasta_reader import is_fasta_file, read_fasta, read_fasta_genome
+from utils.packed_sequences import PackedSequences, is_packed_dataset
+
 def load_sequences(file_path: str) -> List[str]:
     """
     Loading DNA sequences from a FASTA file
@@ -19,36 +22,106 @@ def load_sequences(file_path: str) -> List[str]:
     Output: a list of DNA sequences
     Output example: ['ACGTACGTACGT', 'TGCATGCATGCA', 'GGGAAAACCCGGG']
     """
-    sequences = []
-    for record in SeqIO.parse(file_path, "fasta"):
-        sequences.append(str(record.seq))
+    _, sequences = read_fasta(file_path, uppercase=False)
     if len(sequences) < 2:
         raise ValueError("At least two sequences are required")
     return sequences
 
-def load_sequences_for_evaluation(file_path: str) -> Tuple[List[str], List[str]]:
-    records = list(SeqIO.parse(file_path, "fasta"))
-    names = [rec.id for rec in records]
-    seqs = [str(rec.seq).upper() for rec in records]
-    return names, seqs
+def load_sequences_for_evaluation(file_path: str, genome_level: bool = False) -> Tuple[List[str], List[str]]:
+    """names and sequences of a FASTA file or packed container; with genome_level the file is one genome (see read_fasta_genome)"""
+    if is_packed_dataset(file_path):
+        return load_packed_dataset(file_path)
+    if genome_level:
+        return read_fasta_genome(file_path)
+    return read_fasta(file_path)
 
-def load_sequences_for_evaluation_from_multiple_files(directory: str) -> Tuple[List[str], List[str]]:
+def load_packed_dataset(file_path: str) -> Tuple[List[str], PackedSequences]:
+    """
+    names and sequences of a packed container (see utils/packed_sequences.py);
+    the sequences stay memory-mapped and are unpacked when accessed
+    """
+    sequences = PackedSequences(file_path)
+    return list(sequences.names), sequences
+
+def find_fasta_files(directory: str) -> List[str]:
+    """all FASTA files (possibly compressed) in a directory and its subdirectories, sorted by path"""
+    return sorted(file_path for file_path in glob.glob(os.path.join(directory, '**', '*'), recursive=True)
+                  if os.path.isfile(file_path) and is_fasta_file(file_path))
+
+def iter_sequence_batches_from_multiple_files(directory: str, n_workers: int = None,
+                                              genome_level: bool = False) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    (names, sequences) of every FASTA file in a directory and its subdirectories,
+    file by file in path order. All files are handed to a pool of n_workers
+    threads (default all cores) at once, so the next files are parsed while the
+    caller works on the ones already yielded. With genome_level every file
+    gives a single sequence named after the file, its contigs separated by
+    CONTIG_BOUNDARY.
     """
-    Load sequences from all FASTA files in a directory and its subdirectories.
+    reader = read_fasta_genome if genome_level else read_fasta
+    # the decompressors release the GIL, so threads decompress several files at once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers or os.cpu_count() or 1) as executor:
+        yield from executor.map(reader, find_fasta_files(directory))
+
+def load_sequences_for_evaluation_from_multiple_files(directory: str, n_workers: int = None,
+                                                      genome_level: bool = False) -> Tuple[List[str], List[str]]:
+    """
+    Load sequences from all FASTA files in a directory and its subdirectories,
+    or from a packed container if one is given instead of the directory.
+    Compressed files (.gz, .bz2, .xz) are read directly, and the files are
+    decompressed and parsed in parallel by n_workers threads (default all cores);
+    the sequences are returned in file path order.
+    With genome_level every file is one genome: a single sequence named after
+    the file whose contigs are separated by CONTIG_BOUNDARY, so that the matrix
+    has one row per genome and no k-mer spans two contigs.
     
     :param directory: The root directory to search for FASTA files.
+    :param n_workers: The number of files read at the same time.
+    :param genome_level: Whether each file is read as one multi-contig genome.
     :return: A tuple containing a list of sequence names and a list of sequences.
     """
+    if is_packed_dataset(directory):
+        return load_packed_dataset(directory)
+
     names = []
     seqs = []
+    for file_names, file_seqs in iter_sequence_batches_from_multiple_files(directory, n_workers, genome_level=genome_level):
+        names.extend(file_names)
+        seqs.extend(file_seqs)
+
+    return names, seqs
+
+def phylip_name(name: str) -> str:
+    """sequence name as it appears in a PHYLIP file (at most 10 characters)"""
+    return name[:10].strip()
 
-    # Use glob to find all FASTA files in the directory and subdirectories
-    fasta_files = glob.glob(os.path.join(directory, '**', '*.fasta'), recursive=True)
+def write_phylip(file_path: str, names: List[str], distance_matrix: List[List[float]]) -> None:
+    """write a square distance matrix in PHYLIP format"""
+    N = len(names)
+    with open(file_path, "w") as f:
+        f.write(f"{N}\n")
+        for i in range(N):
+            name = names[i][:10].ljust(10)  # PHYLIP 格式要求名字最多10字符
+            row = " ".join(f"{distance_matrix[i][j]:.6f}" for j in range(N))
+            f.write(f"{name}{row}\n")
 
-    for file_path in fasta_files:
-        # Parse each FASTA file
-        for record in SeqIO.parse(file_path, "fasta"):
-            names.append(record.id)
-            seqs.append(str(record.seq).upper())
+def write_distance_tsv(file_path: str, names: List[str], distance_matrix: List[List[float]]) -> None:
+    """write every ordered pair as name1<TAB>name2<TAB>distance"""
+    with open(file_path, "w") as f:
+        for i in range(len(names)):
+            for j in range(len(names)):
+                f.write(f"{names[i]}\t{names[j]}\t{distance_matrix[i][j]:.6f}\n")
 
-    return names, seqs
\ No newline at end of file
+def read_phylip(file_path: str) -> Tuple[List[str], List[List[float]]]:
+    """read a square distance matrix written by write_phylip"""
+    with open(file_path) as f:
+        N = int(f.readline())
+        names = []
+        distance_matrix = []
+        for _ in range(N):
+            line = f.readline().rstrip("\n")
+            names.append(line[:10].strip())
+            distance_matrix.append([float(value) for value in line[10:].split()])
+    if any(len(row) != N for row in distance_matrix):
+        raise ValueError(f"{file_path} is not a square {N} x {N} PHYLIP matrix")
+    return names, distance_matrix
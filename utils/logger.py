@@ -1,23 +1,39 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
 from datetime import datetime
 
-def setup_logger(name='global_logger', log_level=logging.INFO):
-    """
-    Set up a logger with a consistent format and file output
-    """
+# Loggers only enqueue their records through a QueueHandler; a QueueListener
+# thread of the main process formats them and writes them to the console and to
+# one timestamped log file per run, so a log call never waits for file I/O.
+# Worker processes send their records over a multiprocessing queue (get_log_queue,
+# created when the first pool is set up) to a second listener on the same handlers:
+# forked processes switch to it right after the fork, spawned ones in their pool
+# initializer through attach_log_queue. setup_logger is idempotent, so calling it
+# at import time in every module adds no handlers and opens no files after the first.
+_handlers = []
+_records = queue.SimpleQueue()
+_listeners = []
+_worker_queue = None
+_logger_names = set()
+
+
+def _is_main_process() -> bool:
+    return multiprocessing.parent_process() is None
+
+
+def _start_listener(name: str, log_level: int) -> None:
     # Define the log directory at the project root
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
     log_dir = os.path.join(project_root, "log")
-    
+
     # Create logs directory if it doesn't exist
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    
-    # Create logger
-    logger = logging.getLogger(name)
-    logger.setLevel(log_level)
-    
+
     # Create formatters
     file_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -25,7 +41,7 @@ def setup_logger(name='global_logger', log_level=logging.INFO):
     console_formatter = logging.Formatter(
         '%(asctime)s - %(levelname)s - %(message)s'
     )
-    
+
     # Create file handler with timestamp in the filename
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     file_handler = logging.FileHandler(
@@ -33,14 +49,79 @@ def setup_logger(name='global_logger', log_level=logging.INFO):
     )
     file_handler.setLevel(log_level)
     file_handler.setFormatter(file_formatter)
-    
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
     console_handler.setFormatter(console_formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger 
\ No newline at end of file
+
+    _handlers.extend([file_handler, console_handler])
+    _listeners.append(logging.handlers.QueueListener(_records, *_handlers, respect_handler_level=True))
+    _listeners[-1].start()
+    atexit.register(stop_log_listener)
+
+
+def _bind(logger: logging.Logger, records) -> None:
+    for handler in [handler for handler in logger.handlers if isinstance(handler, logging.handlers.QueueHandler)]:
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+
+
+def setup_logger(name='global_logger', log_level=logging.INFO):
+    """
+    Set up a logger with a consistent format and file output
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(log_level)
+    if name in _logger_names:
+        return logger
+    _logger_names.add(name)
+    if _is_main_process():
+        if not _handlers:
+            _start_listener(name, log_level)
+        _bind(logger, _records)
+    elif _worker_queue is not None:
+        _bind(logger, _worker_queue)
+    return logger
+
+
+def get_log_queue():
+    """queue that worker processes log into, listened to by the main process; pass it to attach_log_queue"""
+    global _worker_queue
+    if _worker_queue is None and _is_main_process() and _handlers:
+        _worker_queue = multiprocessing.Queue(-1)
+        _listeners.append(logging.handlers.QueueListener(_worker_queue, *_handlers, respect_handler_level=True))
+        _listeners[-1].start()
+    return _worker_queue
+
+
+def attach_log_queue(log_queue) -> None:
+    """pool initializer helper: send the records of this worker process to the main process"""
+    global _worker_queue
+    if log_queue is None or _is_main_process():
+        return
+    _worker_queue = log_queue
+    for name in _logger_names:
+        _bind(logging.getLogger(name), log_queue)
+
+
+def _after_fork_in_child() -> None:
+    # the listener threads are not forked: use the worker queue, or the handlers themselves
+    for name in _logger_names:
+        logger = logging.getLogger(name)
+        if _worker_queue is not None:
+            _bind(logger, _worker_queue)
+        elif _handlers:
+            for handler in [handler for handler in logger.handlers if isinstance(handler, logging.handlers.QueueHandler)]:
+                logger.removeHandler(handler)
+            for handler in _handlers:
+                logger.addHandler(handler)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def stop_log_listener() -> None:
+    """write out the queued records and stop the listener threads"""
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,183 @@
+import json
+import os
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from utils.fasta_reader import genome_name, iter_fasta_records
+from utils.sequence_tool import CONTIG_BOUNDARY
+
+# Packed 2-bit dataset container, in the spirit of UCSC .2bit. Layout:
+#   8 bytes  magic
+#   8 bytes  header length (little-endian uint64)
+#   header   JSON: one entry per sequence with its name, length, and the offset
+#            and size of each of its arrays in the data part
+#   data     per sequence: the bases packed 4 per byte (A=0 C=1 G=2 T=3 from the
+#            high bits down), the runs of non-ACGT characters (start, length,
+#            character; N runs and any other IUPAC code, so sequences come back
+#            exactly) and the soft-masked (lower-case) runs, every array 8-byte aligned
+# The data part is memory-mapped on load and a sequence is only unpacked when it
+# is accessed, so an open dataset needs a quarter of the memory of its strings.
+PACKED_MAGIC = b"SS2BIT01"
+
+_FIELDS = (
+    ("packed", np.uint8),
+    ("n_starts", np.uint32), ("n_lengths", np.uint32), ("n_chars", np.uint8),
+    ("mask_starts", np.uint32), ("mask_lengths", np.uint32),
+)
+# run positions are 32-bit as in .2bit, so a single sequence is limited to 4 Gb
+MAX_PACKED_LENGTH = 1 << 32
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+_INVALID_CODE = 4
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+# the 4 base codes held by every byte value
+_UNPACK_TABLE = (np.arange(256, dtype=np.uint8)[:, None] >> _SHIFTS) & 3
+_CODE_TABLE = np.full(256, _INVALID_CODE, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    _CODE_TABLE[_base] = _code
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """starts and lengths of the runs of True in mask"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def _run_positions(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """every position covered by the runs"""
+    starts, lengths = starts.astype(np.int64), lengths.astype(np.int64)
+    run_offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - run_offsets, lengths) + np.arange(int(lengths.sum()))
+
+
+def pack_sequence(sequence: bytes) -> Dict[str, np.ndarray]:
+    """arrays of the container fields of one sequence"""
+    raw = np.frombuffer(sequence, dtype=np.uint8)
+    lower = (raw >= 97) & (raw <= 122)
+    upper = np.where(lower, raw - 32, raw).astype(np.uint8)
+    codes = _CODE_TABLE[upper]
+    invalid = codes == _INVALID_CODE
+    # a run of non-ACGT characters also ends where the character changes
+    changes = upper[1:] != upper[:-1]
+    first = invalid.copy()
+    first[1:] &= ~invalid[:-1] | changes
+    last = invalid.copy()
+    last[:-1] &= ~invalid[1:] | changes
+    n_starts, n_ends = np.flatnonzero(first), np.flatnonzero(last) + 1
+    codes[invalid] = 0
+    padded = np.zeros(-(-len(raw) // 4) * 4, dtype=np.uint8)
+    padded[:len(raw)] = codes
+    mask_starts, mask_lengths = _runs(lower)
+    return {
+        "packed": (padded.reshape(-1, 4) << _SHIFTS).sum(axis=1, dtype=np.uint8),
+        "n_starts": n_starts, "n_lengths": n_ends - n_starts, "n_chars": upper[n_starts],
+        "mask_starts": mask_starts, "mask_lengths": mask_lengths,
+    }
+
+
+def write_packed_dataset(file_path: str, names: List[str], sequences: Sequence[bytes]) -> None:
+    """write sequences (raw bytes, case kept) into a packed container"""
+    entries, blocks = [], []
+    offset = 0
+    for name, sequence in zip(names, sequences):
+        if len(sequence) >= MAX_PACKED_LENGTH:
+            raise ValueError(f"{name} is too long for a packed container ({len(sequence)} bases)")
+        arrays = pack_sequence(sequence)
+        entry = {"name": name, "length": len(sequence)}
+        for field, dtype in _FIELDS:
+            data = arrays[field].astype(dtype).tobytes()
+            entry[field] = [offset, len(data)]
+            blocks.append(data + b"\0" * (-len(data) % 8))
+            offset += len(blocks[-1])
+        entries.append(entry)
+    header = json.dumps({"sequences": entries}).encode()
+    header += b" " * (-(len(PACKED_MAGIC) + 8 + len(header)) % 8)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PACKED_MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for data in blocks:
+            f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def pack_fasta_files(file_paths: List[str], output_path: str, genome_level: bool = False) -> int:
+    """
+    pack the records of FASTA files (possibly compressed) into one container, or
+    with genome_level one sequence per file (see read_fasta_genome); returns the
+    number of sequences
+    """
+    names, sequences = [], []
+    for file_path in file_paths:
+        if genome_level:
+            contigs = [sequence for _, sequence in iter_fasta_records(file_path)]
+            names.append(genome_name(file_path))
+            sequences.append(CONTIG_BOUNDARY.encode().join(contigs))
+            continue
+        for name, sequence in iter_fasta_records(file_path):
+            names.append(name)
+            sequences.append(sequence)
+    write_packed_dataset(output_path, names, sequences)
+    return len(names)
+
+
+def is_packed_dataset(file_path: str) -> bool:
+    """whether the file is a packed container"""
+    if not os.path.isfile(file_path):
+        return False
+    with open(file_path, "rb") as f:
+        return f.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+
+
+class PackedSequences:
+    def __init__(self, file_path: str, uppercase: bool = True):
+        """
+        read-only list of the sequences of a packed container, backed by a memory map;
+        with uppercase=False the soft-masked runs come back in lower case
+        """
+        self.file_path = file_path
+        self.uppercase = uppercase
+        with open(file_path, "rb") as f:
+            if f.read(len(PACKED_MAGIC)) != PACKED_MAGIC:
+                raise ValueError(f"{file_path} is not a packed sequence container")
+            header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.entries = json.loads(f.read(header_length))["sequences"]
+        data_start = len(PACKED_MAGIC) + 8 + header_length
+        data_size = os.path.getsize(file_path) - data_start
+        self.data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=data_start, shape=(data_size,)) \
+            if data_size else np.zeros(0, dtype=np.uint8)
+        self.names = [entry["name"] for entry in self.entries]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[index] for index in range(len(self)))
+
+    def length(self, index: int) -> int:
+        return self.entries[index]["length"]
+
+    def _array(self, index: int, field: str) -> np.ndarray:
+        offset, size = self.entries[index][field]
+        return self.data[offset:offset + size].view(dict(_FIELDS)[field])
+
+    def codes(self, index: int) -> np.ndarray:
+        """2-bit base codes of a sequence, non-ACGT characters as 4"""
+        codes = _UNPACK_TABLE[self._array(index, "packed")].reshape(-1)[:self.length(index)]
+        codes[_run_positions(self._array(index, "n_starts"), self._array(index, "n_lengths"))] = _INVALID_CODE
+        return codes
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        packed = self._array(index, "packed")
+        raw = _BASES[_UNPACK_TABLE[packed].reshape(-1)[:self.length(index)]]
+        n_lengths = self._array(index, "n_lengths")
+        raw[_run_positions(self._array(index, "n_starts"), n_lengths)] = np.repeat(self._array(index, "n_chars"), n_lengths)
+        if not self.uppercase:
+            raw[_run_positions(self._array(index, "mask_starts"), self._array(index, "mask_lengths"))] += 32
+        return raw.tobytes().decode("latin-1")
@@ -1,5 +1,9 @@
 import random
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
+
+# separates the contigs of a genome-level sequence; no k-mer or spaced word may span it
+CONTIG_BOUNDARY = "|"
 
 def generate_random_sequence(length: int) -> str:
     """generate a random DNA sequence of a given length"""
@@ -28,10 +32,29 @@ def generate_pattern(length):
     """Generate a random binary pattern of given length."""
     return ''.join(random.choice(['0', '1']) for _ in range(length))
 
+@lru_cache(maxsize=None)
+def spaced_seed_patterns(length: int, n_seeds: int = 1, seed: int = 0) -> Tuple[str, ...]:
+    """
+    Deterministic binary seed patterns of a given length, the same for every call
+    with the same arguments, so all pairs and runs use identical spaced seeds.
+    The first and last positions are always match positions ('1').
+    """
+    rng = random.Random(f"{seed}:{length}")
+    patterns = []
+    for _ in range(n_seeds):
+        if length <= 2:
+            patterns.append('1' * length)
+            continue
+        middle = ''.join(rng.choice(['0', '1']) for _ in range(length - 2))
+        patterns.append('1' + middle + '1')
+    return tuple(patterns)
+
 def extract_spaced_word(sequence: str, pattern: str) -> List[str]:
-    words = []
-    pattern_length = len(pattern)
-    for i in range(len(sequence) - pattern_length + 1):
-        spaced_word = ''.join(sequence[i+j] for j in range(pattern_length) if pattern[j] == '1')
-        words.append(spaced_word)
-    return words
\ No newline at end of file
+    """spaced words of all windows, built column-wise from one slice per match position"""
+    n_windows = len(sequence) - len(pattern) + 1
+    if n_windows <= 0:
+        return []
+    columns = [sequence[j:j + n_windows] for j, care in enumerate(pattern) if care == '1']
+    if not columns:
+        return [''] * n_windows
+    return list(map(''.join, zip(*columns)))
@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+# Optional per-stage telemetry of distance computations (config key "telemetry").
+# A Telemetry sums, for every (stage, k), the number of calls, the wall and CPU
+# seconds and the k-mers and sequence bytes processed; k is None for the stages
+# that do not depend on it. Stages:
+#   load                 reading the dataset (runner scripts)
+#   pair                 one whole compute_distance call, all the stages below included
+#   matches, background  matches / background matches of a pair at k (k-mers and bytes: the pair's windows and length)
+#   profile              counting the k-mer profile of one sequence (profile cache misses only)
+#   reverse_complement   reverse complementing a sequence for its profile
+#   intersect            matching two profiles (k-mers: distinct codes of both)
+#   index                building a suffix array index
+#   fit                  the slope fit of F(k) giving p_hat
+#   distance             the Jukes-Cantor estimate
+# Worker processes collect their own Telemetry and send it back with every chunk,
+# the matrix runners write the sum next to the PHYLIP output (write_telemetry_report).
+TELEMETRY_FIELDS = ("stage", "k", "calls", "wall_s", "cpu_s", "kmers", "bytes")
+
+StageKey = Tuple[str, Optional[int]]
+
+
+class Telemetry:
+    def __init__(self):
+        """per (stage, k) totals: [calls, wall seconds, CPU seconds, k-mers, bytes]"""
+        self.stages: Dict[StageKey, list] = {}
+
+    def add(self, stage: str, k: int = None, wall: float = 0.0, cpu: float = 0.0,
+            kmers: int = 0, nbytes: int = 0, calls: int = 1) -> None:
+        entry = self.stages.setdefault((stage, k), [0, 0.0, 0.0, 0, 0])
+        entry[0] += calls
+        entry[1] += wall
+        entry[2] += cpu
+        entry[3] += kmers
+        entry[4] += nbytes
+
+    @contextmanager
+    def measure(self, stage: str, k: int = None):
+        """time the block as one call of stage; it may set the "kmers" and "bytes" of the yielded dict"""
+        counts = {"kmers": 0, "bytes": 0}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counts
+        finally:
+            self.add(stage, k, time.perf_counter() - wall, time.process_time() - cpu, counts["kmers"], counts["bytes"])
+
+    def merge(self, stages: Dict[StageKey, list]) -> None:
+        """add the stages of another Telemetry (e.g. from take() in a worker process)"""
+        for (stage, k), (calls, wall, cpu, kmers, nbytes) in stages.items():
+            self.add(stage, k, wall, cpu, kmers, nbytes, calls)
+
+    def take(self) -> Dict[StageKey, list]:
+        """the stages collected so far, starting over"""
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def rows(self) -> List[dict]:
+        """one row per (stage, k), stages in first-seen order and k ascending"""
+        order = {}
+        for stage, _ in self.stages:
+            order.setdefault(stage, len(order))
+        keys = sorted(self.stages, key=lambda key: (order[key[0]], -1 if key[1] is None else key[1]))
+        return [dict(zip(TELEMETRY_FIELDS, key + tuple(self.stages[key]))) for key in keys]
+
+    def totals(self) -> List[dict]:
+        """one row per stage, summed over k"""
+        total = Telemetry()
+        for (stage, _), values in self.stages.items():
+            total.merge({(stage, None): values})
+        return total.rows()
+
+
+def measure(telemetry: Optional[Telemetry], stage: str, k: int = None):
+    """telemetry.measure(stage, k), or a block that records nothing when telemetry is None"""
+    if telemetry is None:
+        return nullcontext({"kmers": 0, "bytes": 0})
+    return telemetry.measure(stage, k)
+
+
+def make_telemetry(args: dict) -> Optional[Telemetry]:
+    """a Telemetry when args.telemetry is set, None otherwise"""
+    return Telemetry() if args.get("telemetry", False) else None
+
+
+def write_telemetry_report(telemetry: Telemetry, phylip_path: str) -> Tuple[str, str]:
+    """write <phylip name>_telemetry.json (totals and per-k rows) and .csv (per-k rows); returns both paths"""
+    base = os.path.splitext(phylip_path)[0] + "_telemetry"
+    rows = telemetry.rows()
+    with open(base + ".json", "w") as f:
+        json.dump({"totals": telemetry.totals(), "stages": rows}, f, indent=2)
+    with open(base + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TELEMETRY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return base + ".json", base + ".csv"